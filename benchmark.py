@@ -0,0 +1,488 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+import os
+import re
+import sys
+import time
+import tempfile
+import argparse
+import json
+import numpy as np
+
+from dis_win_suggest import W90, parse_eigenval, parse_eig
+
+def read_eigenval_legacy(fname):
+    '''
+    Line-by-line EIGENVAL / .eig parser used by `W90.read_eigenval` before the
+    bulk parser. Only kept here as the reference for timing and checking.
+
+    Return: kpath, kptwt, ebands (nspin, nkpts, nbnds)
+    '''
+    if fname[-3:] == 'eig':
+        data = np.loadtxt(fname)
+        nkpts = int(data[:, 1].max())
+        return None, None, data[:, 2].reshape((nkpts, 1, -1)).swapaxes(0, 1)
+
+    with open(fname) as inp:
+        dat = np.array([line.strip() for line in inp if line.strip()])
+    nspin = int(dat[0].split()[-1])
+    nelect, nkpts, nbnds = map(int, dat[5].split())
+    dat = dat[6:]
+    dump = np.array([xx.split() for xx in dat[::nspin * nbnds + 1]], dtype=float)
+    ebands_flag = np.ones(dat.size, dtype=bool)
+    ebands_flag[::nspin * nbnds + 1] = 0
+    if nspin == 1:
+        ebands = np.array([xx.split()[1] for xx in dat[ebands_flag]], dtype=float)
+    else:
+        ebands = np.array([xx.split()[1:3] for xx in dat[ebands_flag]], dtype=float)
+    ebands.shape = (nkpts, nspin, nbnds)
+    return dump[:nkpts, :3], dump[:nkpts, -1], ebands.swapaxes(0, 1)
+
+def dis_froz_legacy(w90, erange, eps=4e-3):
+    '''
+    Loop over `suggest_froz_max` / `suggest_froz_min` with a boolean mask per call,
+    as `W90.get_dis_froz_df` did before. Only kept here as the reference.
+
+    Return: froz_min, froz_max
+    '''
+    def froz_max(emin, nwann, eps=eps):
+        nwann = nwann if nwann else w90.nwann
+        idx = np.argmax(w90.eband_max >= emin) + nwann
+        return int(w90.emax) + 1. if idx >= w90.nbnds else w90.eband_min[idx] - eps
+
+    def froz_min(emax, nwann):
+        idx = np.argmin(w90.eband_min <= emax) - nwann - 1
+        return int(w90.emin) - 1. if idx < 0 else w90.eband_max[idx] + eps
+
+    emin, emax = erange
+    dN = w90.count_states(erange) - w90.nwann
+    froz_min_list, froz_max_list = [], []
+    for i in range(1, dN + 1, w90.ndeg):
+        froz_max_list.append(froz_max(emin, w90.nwann + i))
+        froz_min_list.append(froz_min(froz_max_list[-1], w90.nwann))
+    num_missing = w90.count_states((emin, min(froz_min_list)))
+    for i in range(w90.nwann - num_missing + 1, w90.nwann, 1):
+        froz_min_list.append(emin)
+        froz_max_list.append(froz_max(emin, i, eps=4e-3))
+    return np.array(froz_min_list), np.array(froz_max_list)
+
+def write_eig(fname, ebands):
+    '''
+    Write band energies (nkpts, nbnds) in Wannier90 .eig format.
+    '''
+    nkpts, nbnds = ebands.shape
+    ib, ik = np.meshgrid(np.arange(1, nbnds + 1), np.arange(1, nkpts + 1))
+    np.savetxt(fname, np.column_stack([ib.ravel(), ik.ravel(), ebands.ravel()]),
+               fmt='%5d%5d%18.12f')
+
+def random_ebands(nkpts, nbnds, emin=-20., emax=20., seed=0):
+    '''
+    Sorted random band energies (nkpts, nbnds) spread over [emin, emax].
+    '''
+    rng = np.random.default_rng(seed)
+    return np.sort(rng.uniform(emin, emax, (nkpts, nbnds)), axis=1)
+
+def write_eigenval(fname, ebands, kpoints=None, nelect=0):
+    '''
+    Write band energies (nspin, nkpts, nbnds) in VASP EIGENVAL format.
+    '''
+    nspin, nkpts, nbnds = ebands.shape
+    kpoints = np.zeros((nkpts, 3)) if kpoints is None else kpoints
+    lines = [f'    1    1    1 {nspin:4d}\n', '  0.1E+02  0.5E-09  0.5E-09  0.5E-09  0.5E-15\n',
+             '  1.0E-004\n', '  CAR\n', ' synthetic\n', f' {nelect:6d} {nkpts:6d} {nbnds:6d}\n']
+    bands = np.arange(1, nbnds + 1)
+    for k in range(nkpts):
+        lines.append(f'\n  {kpoints[k, 0]:.7E}  {kpoints[k, 1]:.7E}  {kpoints[k, 2]:.7E}  {1 / nkpts:.7E}\n')
+        cols = [bands] + [ebands[s, k] for s in range(nspin)] + [np.ones(nbnds)] * nspin
+        fmt = '%5d' + '  %15.6f' * nspin + '  %9.6f' * nspin
+        lines.append('\n'.join(fmt % row for row in zip(*cols)) + '\n')
+    with open(fname, 'w') as f:
+        f.writelines(lines)
+
+def write_band_dat(fname, kk, EE):
+    '''
+    Write bands (nbnds, nk) on k-distance `kk` in the block format of `bnd.dat` / `wannier90_band.dat`.
+    '''
+    with open(fname, 'w') as f:
+        for E in EE:
+            f.write('\n'.join(f'{k: 12.6f} {e: 12.6f}' for k, e in zip(kk, E)) + '\n\n')
+
+def path_bands(kk, nbnds, emin=-20., emax=20., seed=0):
+    '''
+    Smooth sorted model bands (nbnds, nk) along the k-distance `kk`.
+    '''
+    rng = np.random.default_rng(seed)
+    centre = np.sort(rng.uniform(emin, emax, nbnds))
+    amp, freq = rng.uniform(0.2, 1., nbnds), rng.integers(1, 4, nbnds)
+    return np.sort(centre[:, None] + amp[:, None] * np.cos(freq[:, None] * kk / kk.max() * np.pi), axis=0)
+
+def write_wout(fname, nwann=16, ndis=200, niter=1000, seed=0):
+    '''
+    Write a `wannier90.wout` with `ndis` disentanglement and `niter` wannierisation steps.
+    '''
+    rng = np.random.default_rng(seed)
+    lines = [' +---------------------------------------------------------------------+<-- DIS\n',
+             ' |  Iter     Omega_I(i-1)      Omega_I(i)      Delta (frac.)    Time   |<-- DIS\n',
+             ' +---------------------------------------------------------------------+<-- DIS\n']
+    omega = 10. * nwann
+    for i in range(1, ndis + 1):
+        new = omega * (1 - 0.5 / i)
+        lines.append(f'{i:7d}{omega:17.8f}{new:17.8f}{(omega - new) / new:16.3E}{0.01 * i:10.2f}    <-- DIS\n')
+        omega = new
+    lines += ['\n             <<< Disentanglement convergence criteria satisfied >>>\n\n',
+              ' +--------------------------------------------------------------------+<-- CONV\n',
+              ' | Iter  Delta Spread     RMS Gradient      Spread (Ang^2)      Time  |<-- CONV\n',
+              ' +--------------------------------------------------------------------+<-- CONV\n\n']
+    spread = 5. * nwann
+    for it in range(niter + 1):
+        lines.append(' ' + '-' * 78 + '\n' + (' Initial State\n' if it == 0 else f' Cycle: {it:6d}\n'))
+        centres, spreads = rng.normal(size=(nwann, 3)), rng.uniform(0.5, 1.5, nwann) * spread / nwann
+        lines += [f'  WF centre and spread{w + 1:5d}  ( {c[0]:10.6f}, {c[1]:10.6f}, {c[2]:10.6f} ) {sp:15.8f}\n'
+                  for w, (c, sp) in enumerate(zip(centres, spreads))]
+        lines.append(f'  Sum of centres and spreads ( {centres.sum(0)[0]:10.6f}, {centres.sum(0)[1]:10.6f}, {centres.sum(0)[2]:10.6f} ) {spreads.sum():15.8f}\n\n')
+        new = spread * (1 - 0.01 / (it + 1))
+        lines.append(f'{it:6d}{new - spread:14.3E}{0.1 / (it + 1):17.10f}{new:19.10f}{0.01 * it:10.2f}  <-- CONV\n')
+        lines.append(f'       O_D=      0.0000000 O_OD=      0.3316148 O_TOT=  {new:13.7f} <-- SPRD\n')
+        spread = new
+    lines.append('\n All done: wannier90 exiting\n')
+    with open(fname, 'w') as f:
+        f.writelines(lines)
+
+def write_vasprun(fname, nsites=2, nkpts=10, nbnds=8, nedos=301, nspin=1, species=('Ga', 'As'), efermi=3.467, seed=0):
+    '''
+    Write a vasprun.xml with structure, eigenvalues, total and LORBIT = 11 partial DOS
+    of `nsites` atoms, which can also be read by `pymatgen`.
+    '''
+    rng = np.random.default_rng(seed)
+    sp = [species[i % len(species)] for i in range(nsites)]
+    types = sorted(set(sp), key=sp.index)
+    lat, pos = np.eye(3) * 5.65, rng.random((nsites, 3))
+    kp = rng.random((nkpts, 3))
+    eb = np.sort(rng.uniform(-10, 15, (nspin, nkpts, nbnds)), axis=-1)
+    ee = np.linspace(-12, 18, nedos)
+    orbs = ['s', 'py', 'pz', 'px', 'dxy', 'dyz', 'dz2', 'dxz', 'x2-y2']
+    pdos = rng.random((nsites, nspin, nedos, len(orbs)))
+
+    def structure(name):
+        attr = f' name="{name}"' if name else ''
+        s = [f' <structure{attr}>\n  <crystal>\n   <varray name="basis" >\n']
+        s += ['    <v> %16.8f %16.8f %16.8f </v>\n' % tuple(v) for v in lat]
+        s.append('   </varray>\n   <i name="volume"> %f </i>\n   <varray name="rec_basis" >\n' % np.linalg.det(lat))
+        s += ['    <v> %16.8f %16.8f %16.8f </v>\n' % tuple(v) for v in np.linalg.inv(lat).T]
+        s.append('   </varray>\n  </crystal>\n  <varray name="positions" >\n')
+        s += ['   <v> %16.8f %16.8f %16.8f </v>\n' % tuple(v) for v in pos]
+        s.append('  </varray>\n </structure>\n')
+        return ''.join(s)
+
+    w = ['<?xml version="1.0" encoding="ISO-8859-1"?>\n<modeling>\n <generator>\n  <i name="program" type="string">vasp </i>\n  <i name="version" type="string">5.4.4.18Apr17-6-g9f103f2a35  </i>\n </generator>\n',
+         f' <incar>\n  <i type="string" name="SYSTEM">synthetic</i>\n  <i type="int" name="ISPIN">{nspin}</i>\n  <i type="int" name="LORBIT">11</i>\n </incar>\n',
+         f' <kpoints>\n  <generation param="listgenerated">\n   <i name="divisions" type="int">{nkpts}</i>\n  </generation>\n  <varray name="kpointlist" >\n']
+    w += ['   <v> %12.8f %12.8f %12.8f </v>\n' % tuple(k) for k in kp]
+    w.append('  </varray>\n  <varray name="weights" >\n' + f'   <v> {1 / nkpts:12.8f} </v>\n' * nkpts + '  </varray>\n </kpoints>\n')
+    w.append(f' <parameters>\n  <separator name="electronic" >\n   <i type="int" name="NBANDS">{nbnds}</i>\n   <i name="NELECT">18</i>\n   <i type="int" name="NELM">60</i>\n   <i type="int" name="IBRION">-1</i>\n   <i type="int" name="NSW">0</i>\n   <separator name="electronic spin" >\n    <i type="int" name="ISPIN">{nspin}</i>\n    <v type="logical" name="LSORBIT"> F </v>\n   </separator>\n  </separator>\n  <i type="int" name="LORBIT">11</i>\n </parameters>\n')
+    w.append(f' <atominfo>\n  <atoms>{nsites}</atoms>\n  <types>{len(types)}</types>\n  <array name="atoms" >\n   <dimension dim="1">ion</dimension>\n   <field type="string">element</field>\n   <field type="int">atomtype</field>\n   <set>\n')
+    w += ['    <rc><c>%2s</c><c>%4d</c></rc>\n' % (s, types.index(s) + 1) for s in sp]
+    w.append('   </set>\n  </array>\n  <array name="atomtypes" >\n   <dimension dim="1">type</dimension>\n   <field type="int">atomspertype</field>\n   <field type="string">element</field>\n   <field>mass</field>\n   <field>valence</field>\n   <field type="string">pseudopotential</field>\n   <set>\n')
+    w += ['    <rc><c>%4d</c><c>%2s</c><c> 69.72</c><c> 13.0</c><c>  PAW_PBE %s 08Apr2002</c></rc>\n' % (sp.count(t), t, t) for t in types]
+    w.append('   </set>\n  </array>\n </atominfo>\n')
+    w.append(structure('initialpos'))
+    w.append(' <calculation>\n' + structure(None).replace('\n ', '\n  '))
+    w.append('  <energy>\n   <i name="e_fr_energy">   -10.0 </i>\n   <i name="e_wo_entrp">   -10.0 </i>\n   <i name="e_0_energy">   -10.0 </i>\n  </energy>\n')
+    w.append('  <eigenvalues>\n   <array>\n    <dimension dim="1">band</dimension>\n    <dimension dim="2">kpoint</dimension>\n    <dimension dim="3">spin</dimension>\n    <field>eigene</field>\n    <field>occ</field>\n    <set>\n')
+    for s in range(nspin):
+        w.append(f'     <set comment="spin {s + 1}">\n')
+        for k in range(nkpts):
+            w.append(f'      <set comment="kpoint {k + 1}">\n')
+            w += ['       <r> %10.4f %8.4f </r>\n' % (e, float(e < efermi)) for e in eb[s, k]]
+            w.append('      </set>\n')
+        w.append('     </set>\n')
+    w.append('    </set>\n   </array>\n  </eigenvalues>\n  <separator name="orbital magnetization" >\n  </separator>\n')
+    w.append(f'  <dos>\n   <i name="efermi">   {efermi:10.8f} </i>\n   <total>\n    <array>\n     <dimension dim="1">gridpoints</dimension>\n     <dimension dim="2">spin</dimension>\n     <field>energy</field>\n     <field>total</field>\n     <field>integrated</field>\n     <set>\n')
+    tdos = pdos.sum(axis=(0, 3))
+    for s in range(nspin):
+        w.append(f'      <set comment="spin {s + 1}">\n')
+        w += ['       <r> %10.4f %10.4f %10.4f </r>\n' % row for row in zip(ee, tdos[s], np.cumsum(tdos[s]) * (ee[1] - ee[0]))]
+        w.append('      </set>\n')
+    w.append('     </set>\n    </array>\n   </total>\n   <partial>\n    <array>\n     <dimension dim="1">gridpoints</dimension>\n     <dimension dim="2">spin</dimension>\n     <dimension dim="3">ion</dimension>\n     <field>energy</field>\n')
+    w += ['     <field>%6s</field>\n' % o for o in orbs]
+    w.append('     <set>\n')
+    fmt = '        <r>' + ' %8.4f' * (len(orbs) + 1) + ' </r>\n'
+    for n in range(nsites):
+        w.append(f'      <set comment="ion {n + 1}">\n')
+        for s in range(nspin):
+            w.append(f'       <set comment="spin {s + 1}">\n')
+            w += [fmt % (e, *row) for e, row in zip(ee, pdos[n, s])]
+            w.append('       </set>\n')
+        w.append('      </set>\n')
+    w.append('     </set>\n    </array>\n   </partial>\n  </dos>\n </calculation>\n')
+    w.append(structure('finalpos') + '</modeling>\n')
+    with open(fname, 'w') as f:
+        f.writelines(w)
+
+def write_procar(fname, nsites=2, nkpts=10, nbnds=8, nspin=1, emin=-10., emax=15., seed=0):
+    '''
+    Write a LORBIT = 11 PROCAR of `nsites` atoms with random projections.
+    '''
+    rng = np.random.default_rng(seed)
+    orbs = ['s', 'py', 'pz', 'px', 'dxy', 'dyz', 'dz2', 'dxz', 'x2-y2']
+    kp = rng.random((nkpts, 3))
+    eb = np.sort(rng.uniform(emin, emax, (nspin, nkpts, nbnds)), axis=-1)
+    head = 'ion ' + ''.join(f'{o:>7s}' for o in orbs) + '    tot\n'
+    fmt = '%5d ' + ' %6.3f' * (len(orbs) + 1) + '\n'
+    w = ['PROCAR lm decomposed\n']
+    for s in range(nspin):
+        w.append(f'# of k-points:  {nkpts:4d}         # of bands:  {nbnds:4d}         # of ions:  {nsites:4d}\n\n')
+        for k in range(nkpts):
+            w.append(f' k-point {k + 1:5d} :    {kp[k, 0]:10.8f}{kp[k, 1]:11.8f}{kp[k, 2]:11.8f}     weight = {1 / nkpts:10.8f}\n\n')
+            for b in range(nbnds):
+                proj = rng.random((nsites, len(orbs))) / (nsites * len(orbs))
+                w.append(f'band {b + 1:5d} # energy {eb[s, k, b]:14.8f} # occ.  {float(b < nbnds // 2):10.8f}\n \n' + head)
+                w += [fmt % (i + 1, *p, p.sum()) for i, p in enumerate(proj)]
+                w.append('tot   ' + ' %6.3f' * (len(orbs) + 1) % (*proj.sum(0), proj.sum()) + '\n \n')
+            w.append('\n')
+        w.append('\n')
+    with open(fname, 'w') as f:
+        f.writelines(w)
+
+def write_inputs(path, nkpts=200, nbnds=100, nsites=8, nedos=3001, nwann=16, niter=1000, seed=0):
+    '''
+    Synthetic inputs of all the entry points in `path`: EIGENVAL, wannier90.eig, vasprun.xml,
+    PROCAR, bnd.dat, wannier90_band.dat, wannier90_band.labelinfo.dat and wannier90.wout.
+    `path` is created if it doesn't exist.
+    '''
+    os.makedirs(path, exist_ok=True)
+    ebands = random_ebands(nkpts, nbnds, seed=seed)
+    write_eigenval(f'{path}/EIGENVAL', ebands[None], nelect=nwann)
+    write_eig(f'{path}/wannier90.eig', ebands)
+    write_vasprun(f'{path}/vasprun.xml', nsites=nsites, nkpts=nkpts, nbnds=nbnds, nedos=nedos, seed=seed)
+    write_procar(f'{path}/PROCAR', nsites=nsites, nkpts=nkpts, nbnds=nbnds, seed=seed)
+
+    # VASP bands along a path and the Wannier90 bands of `nwann` of them on a denser path
+    vkk = np.linspace(0, 3 * 2 * np.pi, nkpts)
+    wkk = np.linspace(0, 3, 2 * nkpts)
+    nbnds_excl = (nbnds - nwann) // 2
+    write_band_dat(f'{path}/bnd.dat', vkk, path_bands(vkk, nbnds, seed=seed))
+    wee = path_bands(wkk * 2 * np.pi, nbnds, seed=seed)[nbnds_excl:nbnds_excl+nwann]
+    write_band_dat(f'{path}/wannier90_band.dat', wkk, wee + np.random.default_rng(seed).normal(0, 1e-3, wee.shape))
+    with open(f'{path}/wannier90_band.labelinfo.dat', 'w') as f:
+        f.write(f'G 1 0.0 0 0 0\nX {nkpts + 1} 1.5 0.5 0 0\nL {2 * nkpts} 3.0 0.5 0.5 0.5\n')
+    write_wout(f'{path}/wannier90.wout', nwann=nwann, niter=niter, seed=seed)
+
+def timeit(func, *args, repeat=3, **kwargs):
+    '''
+    Best wall time (s) of `repeat` calls and the result of the last call.
+    '''
+    best = np.inf
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        res = func(*args, **kwargs)
+        best = min(best, time.perf_counter() - t0)
+    return best, res
+
+def bench_read_eigenval(fname, repeat=3):
+    '''
+    Compare the legacy line-by-line parser with the bulk parser on `fname`.
+    '''
+    if fname[-3:] == 'eig':
+        t_bulk, ebands = timeit(parse_eig, fname, repeat=repeat)
+        kpath = kptwt = None
+    else:
+        t_bulk, (_, _, kpath, kptwt, ebands) = timeit(parse_eigenval, fname, repeat=repeat)
+    t_old, (old_kpath, old_kptwt, old_ebands) = timeit(read_eigenval_legacy, fname, repeat=repeat)
+
+    nspin, nkpts, nbnds = ebands.shape
+    print(f'{fname}: nspin = {nspin}, nkpts = {nkpts}, nbnds = {nbnds}')
+    print(f'legacy parser: {t_old:10.4f} s')
+    print(f'bulk parser:   {t_bulk:10.4f} s    speedup: {t_old / t_bulk:6.1f}x')
+    # legacy ISPIN=2 branch interleaves the spin channels, so only compare ISPIN=1
+    if nspin == 1:
+        same = np.allclose(ebands, old_ebands)
+        if kpath is not None:
+            same = same and np.allclose(kpath, old_kpath) and np.allclose(kptwt, old_kptwt)
+        print(f'identical result: {same}')
+
+def bench_dis_froz(nbnds_list=(1000, 2000, 5000, 10000), nkpts=8, nwann=16, repeat=3):
+    '''
+    Scaling of `W90.get_dis_froz_df` against the legacy loop on synthetic bands,
+    with the energy range covering all bands.
+    '''
+    print(f'{"nbnds":>8s} {"windows":>8s} {"legacy / s":>12s} {"vectorized / s":>15s} {"speedup":>8s}  same')
+    with tempfile.TemporaryDirectory() as tmp:
+        for nbnds in nbnds_list:
+            write_eig(f'{tmp}/wannier90.eig', random_ebands(nkpts, nbnds))
+            w90 = W90(eig='wannier90.eig', path=tmp, efermi=0., nwann=nwann, ndeg=1, cache=False)
+            erange = (w90.emin, w90.emax)
+
+            # silence the report of `get_dis_froz_df`
+            with open(os.devnull, 'w') as null:
+                stdout, sys.stdout = sys.stdout, null
+                t_new, df = timeit(w90.get_dis_froz_df, erange, repeat=repeat)
+                sys.stdout = stdout
+            t_old, (froz_min, froz_max) = timeit(dis_froz_legacy, w90, erange, repeat=repeat)
+            same = np.allclose(df['dis_froz_min'], froz_min) and np.allclose(df['dis_froz_max'], froz_max)
+            print(f'{nbnds:8d} {len(df):8d} {t_old:12.4f} {t_new:15.4f} {t_old / t_new:7.1f}x  {same}')
+
+def bench_stages(nkpts=200, nbnds=100, nsites=8, nedos=3001, nwann=16, niter=1000, repeat=3, output=None, compare=None):
+    '''
+    Time each stage (parse, integrate, suggest, evaluate, plot) of the entry points
+    on synthetic inputs of the given sizes, and write the results as JSON to `output`.
+    With `compare`, print the ratio to the results of an earlier JSON file.
+    '''
+    import logging
+    import platform
+    from contextlib import redirect_stdout
+    import cmp_vasp_w90
+    from cmp_vasp_w90 import parse_dat, evaluate_cmp_vasp_w90, plot_cmp_vasp_w90
+    from pre_w90_tool import gen_dos_df, DosWindowIndex
+    from vasprun_reader import read_vasprun, read_efermi
+    from procar_reader import read_procar
+    from wout_reader import WoutParser
+
+    def wout(fname):
+        parser = WoutParser(fname)
+        parser.update()
+        return parser
+
+    sizes = {'nkpts': nkpts, 'nbnds': nbnds, 'nsites': nsites, 'nedos': nedos, 'nwann': nwann, 'niter': niter}
+    times = {}
+    logging.disable(logging.INFO)
+    with tempfile.TemporaryDirectory() as tmp, open(os.devnull, 'w') as null, redirect_stdout(null):
+        write_inputs(tmp, nkpts=nkpts, nbnds=nbnds, nsites=nsites, nedos=nedos, nwann=nwann, niter=niter)
+        cwd = os.getcwd()
+        os.chdir(tmp)       # `plot_cmp_vasp_w90` reads `wannier90_band.labelinfo.dat` in the working directory
+        try:
+            times['parse/eigenval'], _ = timeit(parse_eigenval, 'EIGENVAL', repeat=repeat)
+            times['parse/eig'], _ = timeit(parse_eig, 'wannier90.eig', repeat=repeat)
+            times['parse/efermi'], _ = timeit(read_efermi, 'vasprun.xml', repeat=repeat)
+            times['parse/vasprun_pdos'], run = timeit(read_vasprun, 'vasprun.xml', True, True, True, repeat=repeat)
+            times['parse/bnd_dat'], (vkk, vee) = timeit(parse_dat, 'bnd.dat', False, repeat=repeat)
+            times['parse/wannier90_band_dat'], (wkk, wee) = timeit(parse_dat, 'wannier90_band.dat', False, repeat=repeat)
+            times['parse/wout'], _ = timeit(wout, 'wannier90.wout', repeat=repeat)
+            times['parse/procar_index'], procar = timeit(read_procar, 'PROCAR', repeat=repeat)
+
+            erange = (run.energies[len(run.energies) // 4], run.energies[len(run.energies) // 2])
+            selected = [f'{run.structure[0].species_string}_0_{o}' for o in ['py', 'pz', 'px']]
+            times['integrate/gen_dos_df'], _ = timeit(gen_dos_df, run, *erange, repeat=repeat)
+            index = DosWindowIndex(run, selected)
+            fmin = np.linspace(erange[0], erange[1], 10000)
+            times['integrate/score_windows'], _ = timeit(index.score, fmin, fmin + 1., repeat=repeat)
+            times['integrate/procar_window'], _ = timeit(procar.window_weights, -1., 1., repeat=repeat)
+
+            w90 = W90(eig='EIGENVAL', path='.', efermi=0., nwann=nwann, ndeg=1, cache=False)
+            erange = (w90.emin, w90.emax)
+            times['suggest/dis_froz_df'], _ = timeit(w90.get_dis_froz_df, erange, repeat=repeat)
+            times['suggest/optimize_windows'], _ = timeit(w90.optimize_windows, (-5., 5.), 0.1, repeat=repeat)
+
+            times['evaluate/cmp_vasp_w90'], _ = timeit(evaluate_cmp_vasp_w90, vkk, vee, wkk, wee, repeat=repeat)
+            cmp_vasp_w90.output_figure = 'cmp.png'
+            times['plot/cmp_vasp_w90'], _ = timeit(plot_cmp_vasp_w90, vkk, vee, wkk, wee, None, 0, 'DejaVu Sans', repeat=repeat)
+        finally:
+            os.chdir(cwd)
+    logging.disable(logging.NOTSET)
+
+    old = None
+    if compare:
+        with open(compare) as f:
+            old = json.load(f)
+        if old['sizes'] != sizes:
+            print(f'WARNING: sizes of {compare} are different: {old["sizes"]}')
+        old = old['times']
+    print(f'{"stage":<28s} {"time / s":>10s}' + (f' {"before / s":>11s} {"ratio":>7s}' if old else ''))
+    for stage, t in times.items():
+        line = f'{stage:<28s} {t:10.4f}'
+        if old and stage in old:
+            line += f' {old[stage]:11.4f} {t / old[stage]:7.2f}'
+        print(line)
+
+    if output:
+        result = {'sizes': sizes, 'times': times, 'repeat': repeat,
+                  'python': platform.python_version(), 'numpy': np.__version__,
+                  'date': time.strftime('%Y-%m-%dT%H:%M:%S')}
+        with open(output, 'w') as f:
+            json.dump(result, f, indent=2)
+        print(f'Results written to {output}')
+    return times
+
+HEAVY_MODULES = ('matplotlib', 'pandas', 'scipy', 'pymatgen')
+
+def bench_startup(repeat=3, target=0.15):
+    '''
+    Wall time of the CLIs in modes which only print text, and the heavy packages they import.
+    `template` and `kpath` of `pre_w90_tool.py` should take less than `target` seconds
+    more than the bare interpreter, which only leaves room for numpy.
+    '''
+    import subprocess
+
+    here = os.path.dirname(os.path.abspath(__file__))
+    with tempfile.TemporaryDirectory() as tmp:
+        with open(f'{tmp}/KPOINTS', 'w') as f:
+            f.write('k-path\n  40\nLine-mode\nReciprocal\n'
+                    '  0.0 0.0 0.0 ! G\n  0.5 0.0 0.5 ! X\n\n'
+                    '  0.5 0.0 0.5 ! X\n  0.5 0.5 0.5 ! L\n')
+        commands = [('python', ['-c', 'pass'], False),
+                    ('pre_w90_tool.py template', [f'{here}/pre_w90_tool.py', 'template'], True),
+                    ('pre_w90_tool.py kpath', [f'{here}/pre_w90_tool.py', 'kpath', '--path', tmp], True),
+                    ('dis_win_suggest.py -h', [f'{here}/dis_win_suggest.py', '-h'], False),
+                    ('cmp_vasp_w90.py -h', [f'{here}/cmp_vasp_w90.py', '-h'], False)]
+
+        print(f'{"command":<28s} {"time / ms":>10s} {"-python":>8s}  heavy imports')
+        python = 0.
+        for name, cmd, check in commands:
+            best, _ = timeit(subprocess.run, [sys.executable] + cmd, repeat=repeat,
+                             capture_output=True, check=True)
+            err = subprocess.run([sys.executable, '-X', 'importtime'] + cmd, capture_output=True, text=True).stderr
+            loaded = [m for m in HEAVY_MODULES if re.search(rf'\|\s+{m}$', err, re.M)]
+            python = python if python else best
+            status = ('OK' if best - python < target else 'SLOW') if check else ''
+            print(f'{name:<28s} {best * 1000:10.1f} {(best - python) * 1000:8.1f}  {",".join(loaded) if loaded else "-":<18s} {status}')
+
+def get_args():
+    '''
+    CML parser.
+    '''
+    parser = argparse.ArgumentParser(description='Timing of Wannier90_Toolbox stages.', add_help=True)
+    parser.add_argument('mode', help='Mode: eigenval, froz, stages, generate, import')
+    parser.add_argument('-i', dest='eig', action='store', type=str,
+                        default='EIGENVAL',
+                        help='EIGENVAL or wannier90.eig file to parse. Default: EIGENVAL')
+    parser.add_argument('-r', dest='repeat', action='store', type=int,
+                        default=3,
+                        help='Number of repeats for each timing. Default: 3')
+    parser.add_argument('--nkpts', default=200, type=int,
+                        help='Number of k-points of synthetic inputs. Default: 200')
+    parser.add_argument('--nbnds', default=100, type=int,
+                        help='Number of bands of synthetic inputs. Default: 100')
+    parser.add_argument('--nsites', default=8, type=int,
+                        help='Number of atoms in synthetic vasprun.xml. Default: 8')
+    parser.add_argument('--nedos', default=3001, type=int,
+                        help='Number of DOS energies in synthetic vasprun.xml. Default: 3001')
+    parser.add_argument('--nwann', default=16, type=int,
+                        help='Number of WFs of synthetic inputs. Default: 16')
+    parser.add_argument('--niter', default=1000, type=int,
+                        help='Number of wannierisation steps in synthetic wannier90.wout. Default: 1000')
+    parser.add_argument('-o', dest='output', default=None,
+                        help='JSON file to write the timings of `stages` mode, or the directory of `generate` mode')
+    parser.add_argument('--compare', default=None,
+                        help='JSON file of earlier `stages` timings to compare with')
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = get_args()
+
+    if args.mode[0].lower() == 'e':     # eigenval
+        bench_read_eigenval(args.eig, repeat=args.repeat)
+    elif args.mode[0].lower() == 'f':   # froz
+        bench_dis_froz(repeat=args.repeat)
+    elif args.mode[0].lower() == 's':   # stages
+        bench_stages(nkpts=args.nkpts, nbnds=args.nbnds, nsites=args.nsites, nedos=args.nedos,
+                     nwann=args.nwann, niter=args.niter, repeat=args.repeat,
+                     output=args.output, compare=args.compare)
+    elif args.mode[0].lower() == 'g':   # generate
+        path = args.output if args.output else '.'
+        write_inputs(path, nkpts=args.nkpts, nbnds=args.nbnds, nsites=args.nsites, nedos=args.nedos,
+                     nwann=args.nwann, niter=args.niter)
+        print(f'Synthetic inputs written to {path}')
+    elif args.mode[0].lower() == 'i':   # import
+        bench_startup(repeat=args.repeat)
+    else:
+        print(f'Unsupported mode: {args.mode}')
@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+from vasprun_reader import read_efermi, read_vasprun
+
+# pieces of vasprun.xml which can be requested from `read_vasprun`
+VASPRUN_PIECES = ['structure', 'tdos', 'pdos', 'eigenvalues', 'kpoints']
+
+class Calculation():
+    '''
+    Input files of the calculation in `path`, shared by the tools so that each file is
+    read at most once per process. Every piece is loaded on first access and memoized.
+
+    eig:      EIGENVAL or Wannier90 .eig file of the band energies
+    efermi:   Fermi level. Read from vasprun.xml if None
+    cache:    use the binary cache of the parsed band energies
+    vasprun:  pieces of vasprun.xml the caller will need, read together on the first access
+    '''
+    def __init__(self, path='.', eig='EIGENVAL', efermi=None, cache=True, vasprun=()):
+        self.path = path
+        self.eig = eig
+        self.cache = cache
+        self._efermi = None if efermi is None else float(efermi)
+        self._pieces = set(vasprun)
+        self._vasprun = None
+        self._eigenval = None
+        self._procar = None
+        self._dos_index = {}
+
+    @property
+    def efermi(self):
+        '''
+        Fermi level of vasprun.xml. It is taken from the pieces if vasprun.xml is already read,
+        otherwise `read_efermi` only scans the end of the file.
+        '''
+        if self._efermi is None:
+            if self._vasprun is None:
+                self._efermi = read_efermi(f'{self.path}/vasprun.xml')
+            else:
+                self._efermi = self._vasprun.efermi
+        return self._efermi
+
+    @property
+    def eigenval(self):
+        '''
+        Band energies of `eig` as returned by `dis_win_suggest.load_eigenval`.
+        '''
+        if self._eigenval is None:
+            from dis_win_suggest import load_eigenval
+            self._eigenval = load_eigenval(f'{self.path}/{self.eig}', cache=self.cache)
+        return self._eigenval
+
+    @property
+    def procar(self):
+        '''
+        `ProcarIndex` of PROCAR. Only the band offsets and energies are read, the projections
+        are parsed on demand.
+        '''
+        if self._procar is None:
+            from procar_reader import read_procar
+            self._procar = read_procar(f'{self.path}/PROCAR')
+        return self._procar
+
+    @property
+    def structure(self):
+        return self.vasprun('structure').structure
+
+    def vasprun(self, *pieces):
+        '''
+        `VasprunData` with at least `pieces` of `VASPRUN_PIECES`. vasprun.xml is read once
+        with these pieces and those given to `__init__`, and only read again if a later
+        call asks for a piece which was not read.
+        '''
+        if self._vasprun is None or not self._pieces.issuperset(pieces):
+            self._pieces.update(pieces)
+            self._vasprun = read_vasprun(f'{self.path}/vasprun.xml', **{p: p in self._pieces for p in VASPRUN_PIECES})
+        return self._vasprun
+
+    def dos_index(self, selected, spin=0):
+        '''
+        `DosWindowIndex` of the `selected` orbitals (e.g. from `select_str2list`) in `spin` channel.
+        '''
+        key = (frozenset(selected), spin)
+        if key not in self._dos_index:
+            from pre_w90_tool import DosWindowIndex
+            self._dos_index[key] = DosWindowIndex(self.vasprun('pdos'), selected, spin=spin)
+        return self._dos_index[key]
+
+    def loaded(self):
+        '''
+        Names of the pieces loaded so far.
+        '''
+        res = [] if self._efermi is None else ['efermi']
+        res += [] if self._eigenval is None else [self.eig]
+        res += [] if self._vasprun is None else [f'vasprun.xml({",".join(sorted(self._pieces))})']
+        res += [] if self._procar is None else ['PROCAR index']
+        return res + [f'DosWindowIndex({len(key)} orbitals, spin {spin})' for key, spin in self._dos_index]
+
+def vasprun_of(data, *pieces):
+    '''
+    `data` if it is already `VasprunData`, or the `pieces` of vasprun.xml of the `Calculation` `data`.
+    '''
+    return data.vasprun(*pieces) if isinstance(data, Calculation) else data
@@ -1,25 +1,58 @@
 #!/usr/bin/env python
 # -*- coding: UTF-8 -*-
-import os, re
-import pandas as pd
+import os, re, time
 import numpy as np
-import matplotlib.pyplot as plt
 import argparse
-import matplotlib as mpl
 import logging
-from scipy import interpolate
-from scipy.signal import savgol_filter
-mpl.use("Agg")
+from itertools import repeat
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+from vasprun_reader import read_efermi
+from calculation import Calculation
+from w90cache import load_cache, save_cache
+from wannier_hr import WannierHR
+from wout_reader import WoutParser
+from profiler import PROFILER, profiled
 
 logging.basicConfig(level = logging.INFO)
 logger = logging.getLogger("cmp")
 
-def parse_dat(datfile):
-    data = pd.read_csv(datfile, header=None, sep=r'\s+', comment='#')
-    k_idxs = np.where(data[0]==np.min(data[0]))[0]
-    nk = k_idxs[1] - k_idxs[0]
-    kk = np.array(data[0])[:nk]
-    EE = np.array(data[1]).reshape(-1, nk)
+COMMENT_RE = re.compile(rb'(?m)^[ \t]*#[^\n]*(?:\n|$)')
+BLANK_RE = re.compile(rb'\n[ \t\r]*\n')
+
+@profiled
+def parse_dat(datfile, cache=True):
+    '''
+    Bulk loader of band data in p4vasp format (`bnd.dat`) or `wannier90_band.dat`:
+    one block of `k E ...` lines per band, with blocks separated by blank lines.
+
+    The block length is the number of lines before the first blank line, and all
+    the numbers are converted in one pass. The result is memory mapped from the
+    binary cache `.{datfile}.w90cache` if it is up to date.
+
+    Return: kk (nk,), EE (nbnds, nk)
+    '''
+    data = load_cache(datfile) if cache else None
+    if data is not None:
+        return data['kk'], data['EE']
+
+    with open(datfile, 'rb') as f:
+        raw = f.read()
+    if b'#' in raw:
+        raw = COMMENT_RE.sub(b'', raw)
+    raw = raw.strip()
+    m = BLANK_RE.search(raw)
+    first = raw[:m.start()] if m else raw
+    nk = first.count(b'\n') + 1
+    ncol = len(first.split(b'\n', 1)[0].split())
+
+    table = np.fromstring(raw.decode(), sep=' ')
+    if table.size % (nk * ncol) != 0:
+        raise ValueError(f'Cannot parse {datfile}: {table.size} numbers for blocks of {nk} lines with {ncol} columns.')
+    table.shape = (-1, nk, ncol)
+    kk, EE = table[0, :, 0].copy(), np.ascontiguousarray(table[:, :, 1])
+    if cache:
+        save_cache(datfile, {'kk': kk, 'EE': EE}, ['kk', 'EE'])
     return kk, EE
 
 # Used in wannier_fit evaluation
@@ -33,12 +66,65 @@ def unit(x, mid=0, width=3):
     res = np.abs(x-mid) < width
     return res.astype(float)
 
+def band_offset(ve, we):
+    '''
+    Offset of the Wannier90 bands `we` (Nw, nk) inside the VASP bands `ve` (Nv, nk)
+    on the same k-points. The squared distance of every offset is computed at once,
+    with the cross term as a correlation along the band axis.
+
+    Return: offset, residual (root mean square difference in eV at the best offset)
+    '''
+    from scipy.signal import fftconvolve
+
+    Nv, Nw = len(ve), len(we)
+    if Nv < Nw:
+        raise ValueError(f'There are less VASP bands ({Nv}) than Wannier90 bands ({Nw}).')
+
+    # sum_b (ve[i+b] - we[b])^2 = sum_b ve[i+b]^2 - 2 sum_b ve[i+b] we[b] + sum_b we[b]^2
+    csum = np.concatenate([[0], np.cumsum(np.sum(ve**2, axis=1))])
+    dist = csum[Nw:] - csum[:-Nw] + np.sum(we**2) \
+           - 2 * np.sum(fftconvolve(ve, we[::-1], mode='valid', axes=0), axis=1)
+    offset = int(np.argmin(dist))
+    residual = np.sqrt(np.mean((ve[offset:offset+Nw] - we)**2))
+    return offset, residual
+
+@profiled
+def align_bands(vkk, vee, wkk, wee, nsample=32):
+    '''
+    Number of VASP bands below the Wannier90 bands.
+
+    Wannier90 bands are linearly interpolated on (at most) `nsample` VASP k-points
+    along the path and compared with `band_offset`.
+
+    Return: offset, residual (root mean square difference in eV at the best offset)
+    '''
+    w2v_ratio = np.max(vkk) / np.max(wkk)
+
+    ik = np.unique(np.linspace(0, len(vkk) - 1, nsample).astype(int))
+    x = np.clip(vkk[ik] / w2v_ratio, wkk[0], wkk[-1])
+    j = np.clip(np.searchsorted(wkk, x, side='right'), 1, len(wkk) - 1)
+    dk = wkk[j] - wkk[j-1]
+    t = np.where(dk > 0, (x - wkk[j-1]) / np.where(dk > 0, dk, 1), 0)
+    we = wee[:, j-1] * (1 - t) + wee[:, j] * t                  # (Nw, nk)
+    return band_offset(vee[:, ik], we)
+
+@profiled
 def plot_cmp_vasp_w90(vkk, vee, wkk, wee, 
                       ylim=None,
                       efermi=0,
-                      font="Open Sans", size=18):
+                      font="Open Sans", size=18,
+                      labelinfo='wannier90_band.labelinfo.dat', output=None):
+    import matplotlib as mpl
+    mpl.use("Agg")
+    import matplotlib.pyplot as plt
+    from matplotlib.collections import LineCollection
+
     w2v_ratio = np.max(vkk) / np.max(wkk)   # Theoretically, it should be 2 * pi
 
+    # get plot bound
+    if not ylim:
+        ylim = (wee.min()-efermi-1, wee.max()-efermi+1)
+
     # general options for plot
     plt.rcParams['font.family'] = font
     plt.rcParams['font.weight'] = "regular"
@@ -47,25 +133,27 @@ def plot_cmp_vasp_w90(vkk, vee, wkk, wee,
     # plot
     fig, ax = plt.subplots(figsize=(8, 6))
 
-    for idx, EE in enumerate(vee):
-        ax.plot(vkk / w2v_ratio,
-                EE - efermi,
-                'k-',
-                label='VASP' if idx==0 else None)
-    for idx, EE in enumerate(wee):
-        ax.plot(wkk[::1],
-                EE[::1] - efermi,
-                'r--',
-                label='Wannier90' if idx==0 else None)
+    # all the bands of each source as one collection, without the bands outside `ylim`
+    for kk, ee, style, label in [(vkk / w2v_ratio, vee, ('k', '-'), 'VASP'),
+                                 (wkk, wee, ('r', '--'), 'Wannier90')]:
+        ee = ee - efermi
+        ee = ee[(ee.max(axis=1) >= ylim[0]) & (ee.min(axis=1) <= ylim[1])]
+        segments = np.stack([np.broadcast_to(kk, ee.shape), ee], axis=-1)
+        ax.add_collection(LineCollection(segments, colors=style[0], linestyles=style[1], label=label))
 
     # kpoints labels: from `wannier90_band.labelinfo.dat` file
-    with open('wannier90_band.labelinfo.dat', 'r') as f:
-        lines = f.readlines()
-    label = [l.split()[0] for l in lines]
+    if os.path.isfile(labelinfo):
+        with open(labelinfo, 'r') as f:
+            lines = f.readlines()
+        label = [l.split()[0] for l in lines]
+        k_node = [eval(l.split()[2]) for l in lines]
+    else:
+        # no labels, only the ends of line segments (repeated k-distance)
+        k_node = list(wkk[np.concatenate([[0], np.where(np.diff(wkk) < 1e-7)[0], [-1]])])
+        label = [''] * len(k_node)
     logger.info(f"k label: {label}")
-    k_node = [eval(l.split()[2]) for l in lines]
     for i, lab in enumerate(label):
-        if lab[-1].isdigit():
+        if lab and lab[-1].isdigit():
             label[i] = lab[:-1] + r'$_' + lab[-1] + r'$'
    
     ax.set_xlim(k_node[0], k_node[-1])
@@ -77,9 +165,6 @@ def plot_cmp_vasp_w90(vkk, vee, wkk, wee,
     ax.hlines(y=0, xmin=k_node[0], xmax= k_node[-1], color="grey", linestyles="dashed", lw=0.5)
     ax.set_ylabel("Energy / eV")
 
-    # get plot bound
-    if not ylim:
-        ylim = (wee.min()-efermi-1, wee.max()-efermi+1)
     ax.set_ylim(ylim)
     logger.info(f"Energy range: {ylim}")
 
@@ -95,58 +180,115 @@ def plot_cmp_vasp_w90(vkk, vee, wkk, wee,
               prop={'size': 14})
 
     # plt.show()
-    plt.savefig(output_figure,  bbox_inches='tight', transparent=True, dpi=300)
-    logger.info(f"Output figure: {output_figure}")
-
-def evaluate_cmp_vasp_w90(vkk, vee, wkk, wee, kernel='unit', mid=0, width=3):
+    output = output if output else output_figure
+    plt.savefig(output,  bbox_inches='tight', transparent=True, dpi=300)
+    plt.close(fig)
+    logger.info(f"Output figure: {output}")
 
+def get_kernel(kernel='unit', mid=0, width=3):
     if kernel[0].lower() == 'u':
-        kernel = lambda x: unit(x, mid=mid, width=width)
+        return lambda x: unit(x, mid=mid, width=width)
     elif kernel[0].lower() == 'g':
-        kernel = lambda x: gaussian(x, mid=mid, width=width)
+        return lambda x: gaussian(x, mid=mid, width=width)
+    raise ValueError(f'Unsupported kernel: {kernel}')
+
+@profiled
+def evaluate_cmp_vasp_w90(vkk, vee, wkk, wee, kernel='unit', mid=0, width=3, nbnds_excl=None):
+    '''
+    Kernel weighted max error (meV) of each Wannier90 band against the VASP bands.
+    The number of VASP bands below the Wannier90 bands is found with `align_bands`
+    unless `nbnds_excl` is given.
+
+    Return: dEs (Nw,), wgts (Nw,)
+    '''
+    from scipy import interpolate
+    from scipy.signal import savgol_filter
+
+    kernel = get_kernel(kernel, mid=mid, width=width)
 
     nbnds, _ = wee.shape  # num of bands in wannier90
     w2v_ratio = np.max(vkk) / np.max(wkk)   # Theoretically, it should be 2 * pi
 
-    ve, we = vee[:, 0], wee[:, 0]
-    Nv, Nw = len(ve), len(we)
-    diff = np.array([np.sum(np.abs(ve[i:i+Nw] - we)) for i in range(Nv-Nw+1)])
-    nbnds_excl = np.argmin(diff)
-    logger.info(f"nbnds_excl: {nbnds_excl}")
-
-    dEs, wgts = [], []
+    if nbnds_excl is None:
+        nbnds_excl, residual = align_bands(vkk, vee, wkk, wee)
+        logger.info(f"nbnds_excl: {nbnds_excl}    residual: {residual * 1000:.3f} meV")
 
     # mask of VASP data
     diff_vkk = vkk[1:] - vkk[:-1]
-    vmask = [True] + list(np.logical_not(diff_vkk < 1e-7))
+    vmask = np.concatenate([[True], diff_vkk >= 1e-7])
     # mask of W90 data
     diff_wkk = wkk[1:] - wkk[:-1]
-    wmask = list(np.logical_not(diff_wkk < 1e-7)) + [True]
-
-    for i in range(nbnds):
-        # Interpolation need to remove the duplicates
-        # REF: https://stackoverflow.com/questions/12054060/scipys-splrep-splev-for-python-interpolation-returns-nan
-
-        tck = interpolate.splrep(wkk[wmask], wee[i][wmask])
-        fit_wee_i = interpolate.splev(vkk[vmask] / w2v_ratio, tck)
-        vee_i = vee[i + nbnds_excl][vmask]
-
-        dEi = fit_wee_i - vee_i
-        # Using filter to smooth the data and remove
-        # https://docs.scipy.org/doc/scipy/reference/generated/scipy.signal.savgol_filter.html
-        dEi =  np.abs(savgol_filter(dEi, 9, 2))
-
-        # ! AVERAGE DISTANCE
-        # dEs.append(np.sum(kernel(vee[i + nbnds_excl][vmask]) * dEi) / len(dEi) * 1000)
-        # wgts.append(np.sum(kernel(vee[i + nbnds_excl][vmask])) / len(dEi))
-
-        # ! MAX DISTANCE
-        dEs.append(np.max(kernel(vee_i) * dEi) * 1000)
-        wgts.append(np.max(kernel(vee_i)))
-
-    dEs, wgts = np.array(dEs), np.array(wgts)
+    wmask = np.concatenate([diff_wkk >= 1e-7, [True]])
+
+    # Interpolation need to remove the duplicates
+    # REF: https://stackoverflow.com/questions/12054060/scipys-splrep-splev-for-python-interpolation-returns-nan
+    # All bands share the k-grid, so one not-a-knot cubic spline (the same as `splrep` with s=0) fits all of them.
+    spl = interpolate.make_interp_spline(wkk[wmask], wee[:, wmask], k=3, axis=1)
+    fit_wee = spl(vkk[vmask] / w2v_ratio)
+    vee_sel = vee[nbnds_excl:nbnds_excl+nbnds, vmask]
+
+    # Using filter to smooth the data and remove
+    # https://docs.scipy.org/doc/scipy/reference/generated/scipy.signal.savgol_filter.html
+    dE = np.abs(savgol_filter(fit_wee - vee_sel, 9, 2, axis=1))
+    wgt = kernel(vee_sel)
+
+    # ! AVERAGE DISTANCE
+    # dEs = np.sum(wgt * dE, axis=1) / dE.shape[1] * 1000
+    # wgts = np.sum(wgt, axis=1) / dE.shape[1]
+
+    # ! MAX DISTANCE
+    dEs = np.max(wgt * dE, axis=1) * 1000
+    wgts = np.max(wgt, axis=1)
     return dEs, wgts
 
+@profiled
+def evaluate_mesh(kpts, ebands, hr, kernel='unit', mid=0, width=3, nsample=64, workers=None, chunk=None):
+    '''
+    Errors of the Wannier90 bands from `hr` (`WannierHR`) against VASP band energies
+    `ebands` (nk, Nv) on their k-points `kpts` (nk, 3), e.g. the uniform mesh of EIGENVAL.
+
+    The band offset is found on `nsample` k-points. Then the k-points are split into
+    chunks of `chunk` k-points (256 MB in total by default) evaluated by `workers` threads,
+    and each chunk is reduced to its statistics as soon as it is done, so the memory
+    doesn't grow with the number of k-points. There is no smoothing since the
+    k-points are not ordered along a path.
+
+    Return: offset,
+            DataFrame of each band with kernel weighted `max` and `mean` error (meV) and `wgt`,
+            DataFrame of each k-point with kernel weighted `max` error (meV)
+    '''
+    import pandas as pd
+
+    kernel = get_kernel(kernel, mid=mid, width=width)
+    nk, nw = len(kpts), hr.num_wann
+    ik = np.unique(np.linspace(0, nk - 1, nsample).astype(int))
+    offset, residual = band_offset(np.asarray(ebands[ik]).T, hr.eigenvalues(kpts[ik]).T)
+    logger.info(f"nbnds_excl: {offset}    residual: {residual * 1000:.3f} meV")
+
+    workers = workers if workers else os.cpu_count()
+    chunk = chunk if chunk else hr.chunk_size(max_mem=256 / workers)
+    def work(start):
+        ve = np.asarray(ebands[start:start+chunk, offset:offset+nw])
+        wgt = kernel(ve)
+        dE = wgt * np.abs(hr.eigenvalues(kpts[start:start+chunk]) - ve) * 1000
+        return start, dE.max(axis=1), dE.max(axis=0), dE.sum(axis=0), wgt.max(axis=0), wgt.sum(axis=0)
+
+    dEk = np.empty(nk)
+    dE_max, dE_sum, wgt_max, wgt_sum = np.zeros(nw), np.zeros(nw), np.zeros(nw), np.zeros(nw)
+    with ThreadPoolExecutor(workers) as pool:
+        for start, ek, emax, esum, wmax, wsum in pool.map(work, range(0, nk, chunk)):
+            dEk[start:start+len(ek)] = ek
+            dE_max, wgt_max = np.maximum(dE_max, emax), np.maximum(wgt_max, wmax)
+            dE_sum, wgt_sum = dE_sum + esum, wgt_sum + wsum
+
+    band_df = pd.DataFrame({'max': dE_max,
+                            'mean': np.divide(dE_sum, wgt_sum, out=np.zeros(nw), where=wgt_sum > 0),
+                            'wgt': wgt_max})
+    k_df = pd.DataFrame(np.asarray(kpts), columns=['kx', 'ky', 'kz'])
+    k_df['max'] = dEk
+    return offset, band_df, k_df
+
+@profiled
 def show_vasp_w90_diff(dEs, wgts):
     import gnuplotlib as gp
 
@@ -159,26 +301,104 @@ def show_vasp_w90_diff(dEs, wgts):
             unset    = 'grid')
     logger.info(f'Average dE (meV): {np.sum(dEs) / np.sum(wgts)}')
 
-def show_spreading(path):
+def plot_spreading(wout):
     import gnuplotlib as gp
 
-    if 'wannier90.wout' in os.listdir(path):
-        conv_str = os.popen(f'grep CONV {path}/wannier90.wout').read().split('\n')
-        if len(conv_str) > 4:
-            conv = conv_str[3:-1]
-            spread = np.array([eval(re.split('\s+', c)[4]) for c in conv])
-
-            x = np.linspace(0, len(spread)-1, len(spread))
-            spread_min = spread.min()
-            gp.plot( x, spread,
-                    _with    = 'lines',
-                    _yrange  = [spread_min * 0.7, spread_min * 2],
-                    terminal = 'dumb 100, 30',
-                    unset    = 'grid')
-            idx = np.argmin(spread)
-            logger.info(f'MIN_NUM_ITER: {idx}   SPREAD: {spread[idx]}')
-    else:
-        logger.info(f"There if no `{path}/wannier90.wout`.")
+    spread = wout.conv[:, 3]
+    spread_min = spread.min()
+    gp.plot( wout.conv[:, 0], spread,
+            _with    = 'lines',
+            _yrange  = [spread_min * 0.7, spread_min * 2],
+            terminal = 'dumb 100, 30',
+            unset    = 'grid')
+    idx = np.argmin(spread)
+    logger.info(f'MIN_NUM_ITER: {int(wout.conv[idx, 0])}   SPREAD: {spread[idx]}')
+
+@profiled
+def show_spreading(path, follow=False, interval=2.):
+    '''
+    Plot the spread of each wannierisation step in `{path}/wannier90.wout`. With `follow`,
+    the file is checked every `interval` seconds and the plot is refreshed with the
+    newly appended lines until wannier90 finishes (or Ctrl-C).
+    '''
+    fname = f'{path}/wannier90.wout'
+    if not os.path.isfile(fname) and not follow:
+        logger.info(f"There if no `{fname}`.")
+        return
+
+    wout = WoutParser(fname)
+    wout.update()
+    if len(wout.conv) > 1:
+        plot_spreading(wout)
+    if not follow:
+        return
+
+    try:
+        while not wout.done:
+            time.sleep(interval)
+            if not wout.update():
+                continue
+            print('\033[H\033[J', end='')     # clear the terminal
+            if len(wout.conv) > 1:
+                plot_spreading(wout)
+            elif len(wout.dis):
+                logger.info(f'DIS ITER: {int(wout.dis[-1, 0])}   OMEGA_I: {wout.dis[-1, 2]}')
+    except KeyboardInterrupt:
+        pass
+    if len(wout.spreads):
+        logger.info(f'WF spreads (Ang^2): {wout.spreads}')
+
+# VASP bands of the worker processes of `rank_runs`, sent once by `init_batch`
+_batch_ref = None
+
+def init_batch(vkk, vee):
+    global _batch_ref
+    _batch_ref = (vkk, vee)
+    logger.setLevel(logging.WARNING)
+
+def evaluate_run(wdir, kernel='unit', mid=0, width=3, cache=True):
+    '''
+    Band error of `{wdir}/wannier90_band.dat` against the VASP bands of `init_batch`,
+    and the final spread of `{wdir}/wannier90.wout`.
+    '''
+    res = {'run': wdir, 'dE': np.nan, 'max_dE': np.nan, 'nbnds_excl': -1,
+           'spread': np.nan, 'niter': 0, 'done': False, 'error': ''}
+    try:
+        vkk, vee = _batch_ref
+        wkk, wee = parse_dat(f'{wdir}/wannier90_band.dat', cache=cache)
+        res['nbnds_excl'] = align_bands(vkk, vee, wkk, wee)[0]
+        dEs, wgts = evaluate_cmp_vasp_w90(vkk, vee, wkk, wee, kernel=kernel, mid=mid, width=width,
+                                          nbnds_excl=res['nbnds_excl'])
+        res['dE'], res['max_dE'] = np.sum(dEs) / np.sum(wgts), np.max(dEs)
+    except Exception as e:
+        res['error'] = f'{type(e).__name__}: {e}'
+
+    wout = WoutParser(f'{wdir}/wannier90.wout')
+    wout.update()
+    if len(wout.conv):
+        res['spread'], res['niter'] = wout.conv[-1, 3], int(wout.conv[-1, 0])
+    elif len(wout.spreads):
+        res['spread'] = wout.spreads.sum()
+    res['done'] = wout.done
+    return res
+
+@profiled
+def rank_runs(vkk, vee, dirs, kernel='unit', mid=0, width=3, workers=None, cache=True):
+    '''
+    Evaluate the Wannier90 runs in `dirs` against the same VASP bands `vkk`, `vee` with
+    `workers` processes, which receive the VASP bands once.
+
+    Return: DataFrame of each run with average and max band error (meV), offset of the
+            bands, final spread (Ang^2), number of iterations, ranked by error and spread
+    '''
+    import pandas as pd
+
+    workers = workers if workers else min(os.cpu_count(), len(dirs))
+    with ProcessPoolExecutor(workers, initializer=init_batch, initargs=(vkk, vee)) as pool:
+        rows = list(pool.map(evaluate_run, dirs, repeat(kernel), repeat(mid), repeat(width), repeat(cache)))
+    df = pd.DataFrame(rows).sort_values(['dE', 'spread'], na_position='last', ignore_index=True)
+    df.index += 1
+    return df
 
 def show_all_fonts():
     # Ref: python - How to get a list of all the fonts currently available for Matplotlib? - Stack Overflow
@@ -188,13 +408,13 @@ def show_all_fonts():
     family_name = set([fm.get_font(i).family_name for i in fpaths])
     logger.info(sorted(family_name))
 
-def get_efermi(args):
+def get_efermi(args, calc=None):
     if args.efermi:
         efermi = float(args.efermi)
+    elif calc:
+        efermi = calc.efermi
     else:
-        efermi_str = os.popen(f'grep fermi {args.path}/vasprun.xml').read().strip()
-        m = re.match('.+ ((\-|\+)?\d+(\.\d+)?) .+', efermi_str)
-        efermi = float(m.groups()[0])
+        efermi = read_efermi(f'{args.path}/vasprun.xml')
     return efermi
 
 def get_args():
@@ -224,38 +444,150 @@ def get_args():
                          help="Don't plot spreading")
     parser.add_argument("--no-quality", default=False, action="store_true",
                          help="Don't show quality of fitting")
+    parser.add_argument("--no-plot", default=False, action="store_true",
+                         help="Don't plot the bands (matplotlib is not imported), only show the quality metrics")
     parser.add_argument("--quiet", default=False, action="store_true",
                          help="Equal to --no-spreading --no-quality")
+    parser.add_argument("--hr", default=None, nargs='?', const='wannier90_hr.dat',
+                        help="Compute Wannier90 bands on the k-points of `vasprun.xml` from `wannier90_hr.dat` (or the given file) instead of reading `wannier90_band.dat`")
+    parser.add_argument("--mesh", default=None, nargs='?', const='EIGENVAL',
+                        help="Evaluate the bands from `wannier90_hr.dat` (or --hr) on all k-points of `EIGENVAL` (or the given file) instead of the band path")
+    parser.add_argument("--workers", default=None, type=int,
+                        help="Number of threads for --mesh or processes for --batch. Default: number of CPUs")
+    parser.add_argument("--follow", default=False, action="store_true",
+                        help="Only follow `wannier90.wout` of a running job and refresh the spreading plot as it grows")
+    parser.add_argument("--interval", default=2., type=float,
+                        help="Seconds between checks of `wannier90.wout` in --follow. Default: 2")
+    parser.add_argument("--spin", default=None, nargs=2, metavar=('UP', 'DOWN'),
+                        help="Directories of the Wannier90 runs of the two spin channels. Compare their `wannier90_band.dat` with `bnd_up.dat` and `bnd_down.dat` (from `pre_w90_tool.py band`) in --path")
+    parser.add_argument("--batch", default=None, nargs='+', metavar='DIR',
+                        help="Directories of Wannier90 runs compared with the same VASP bands --vasp in --path. Write a table ranked by band error and final spread to `{name}_batch_rank.dat`")
+    parser.add_argument("--top", default=0, type=int,
+                        help="Plot the bands of the best N runs of --batch, in `{DIR}/{name}_VASP_W90_cmp.png`. Default: 0")
+    parser.add_argument("--no-cache", default=False, action="store_true",
+                         help="Neither read nor write the binary cache `.{name}.w90cache` of parsed band data")
+    parser.add_argument("--profile", default=None, nargs='?', const='', metavar='FILE',
+                        help="Print wall time and calls of each stage at exit. With FILE, also dump a JSON trace (*.json) or cProfile statistics (other names)")
+    parser.add_argument("--profile-mem", default=False, action="store_true",
+                        help="Also trace the peak memory of each stage with tracemalloc, with or without --profile. It slows down allocations, so the times are larger than without it")
     args = parser.parse_args()
     return args
 
 if __name__ == '__main__':
     args = get_args()
+    if args.profile is not None or args.profile_mem:
+        PROFILER.start(args.profile, memory=args.profile_mem)
 
     name = args.name
     output_figure = f'{args.path}/{name}_VASP_W90_cmp.png'
-    efermi = get_efermi(args)
+    # with --hr, vasprun.xml is only parsed for its k-points
+    calc = Calculation(args.path, args.mesh if args.mesh else 'EIGENVAL', cache=not args.no_cache,
+                       vasprun=('kpoints',) if args.hr and not args.mesh else ())
+    efermi = get_efermi(args, calc=calc)
     
-    logger.info(f'Reading Data from {args.path}/{args.vasp}')
-    vkk, vee = parse_dat(f'{args.path}/{args.vasp}')
-    wkk, wee = parse_dat(f'{args.path}/wannier90_band.dat')
-
-    plot_cmp_vasp_w90(vkk, vee, wkk, wee, 
-                      ylim=args.ylim,
-                      efermi=efermi,
-                      font=args.fontfamily, size=args.fontsize)
-
-    if not args.no_quality and not args.quiet:
-        logger.info('Evaluating Band Quality:')
+    if args.follow:
+        logger.info(f'Following {args.path}/wannier90.wout (Ctrl-C to stop):')
+        show_spreading(args.path, follow=True, interval=args.interval)
+    elif args.mesh:
+        from dis_win_suggest import W90
+
+        logger.info(f'Evaluating Wannier90 bands on k-points of {args.path}/{args.mesh}')
+        w90 = W90(calc=calc, efermi=efermi)
+        hr = WannierHR(args.hr if args.hr else 'wannier90_hr.dat', path=args.path, cache=not args.no_cache)
         l = args.kernel.split(',')
         kernel, mid, width = l[0], float(l[1]), float(l[2])
-        dEs, wgts = evaluate_cmp_vasp_w90(vkk, vee, wkk, wee,
-                                          kernel=kernel, mid=mid, width=width)
-        show_vasp_w90_diff(dEs, wgts)
+        _, band_df, k_df = evaluate_mesh(w90.ir_kpath, w90.ir_ebands[0], hr,
+                                         kernel=kernel, mid=mid, width=width, workers=args.workers)
+        logger.info(f'=== DIFF of VASP vs W90 with each bands (meV) ===\n{band_df}')
+        logger.info(f'Average dE (meV): {np.sum(band_df["max"]) / np.sum(band_df["wgt"])}')
+        logger.info(f'=== k-points with the largest DIFF (meV) ===\n{k_df.nlargest(10, "max")}')
+        k_df.to_csv(f'{args.path}/{name}_mesh_diff.dat', sep=' ', float_format='%.6f', index=False)
+        logger.info(f'Output DIFF of each k-point: {args.path}/{name}_mesh_diff.dat')
+    elif args.spin:
+        import pandas as pd
 
-    if not args.no_spread and not args.quiet:
-        logger.info('Show spreading convergence:')
-        show_spreading(args.path)
+        l = args.kernel.split(',')
+        kernel, mid, width = l[0], float(l[1]), float(l[2])
+        dEs = {}
+        for spin, wdir in zip(['up', 'down'], args.spin):
+            logger.info(f'===== Spin {spin}: {args.path}/bnd_{spin}.dat vs {wdir}/wannier90_band.dat =====')
+            vkk, vee = parse_dat(f'{args.path}/bnd_{spin}.dat', cache=not args.no_cache)
+            wkk, wee = parse_dat(f'{wdir}/wannier90_band.dat', cache=not args.no_cache)
+            if not args.no_plot:
+                plot_cmp_vasp_w90(vkk, vee, wkk, wee,
+                                  ylim=args.ylim,
+                                  efermi=efermi,
+                                  font=args.fontfamily, size=args.fontsize,
+                                  labelinfo=f'{wdir}/wannier90_band.labelinfo.dat',
+                                  output=f'{args.path}/{name}_VASP_W90_cmp_{spin}.png')
+            if not args.no_quality and not args.quiet:
+                dE, wgt = evaluate_cmp_vasp_w90(vkk, vee, wkk, wee,
+                                                kernel=kernel, mid=mid, width=width)
+                dEs[spin] = pd.Series(dE)
+                logger.info(f'Average dE (meV): {np.sum(dE) / np.sum(wgt)}')
+            if not args.no_spread and not args.quiet:
+                show_spreading(wdir)
+        if dEs:
+            logger.info(f'=== MAX DIFF of VASP vs W90 with each bands (meV) ===\n{pd.DataFrame(dEs)}')
+    elif args.batch:
+        import pandas as pd
+
+        logger.info(f'Reading Data from {args.path}/{args.vasp}')
+        vkk, vee = parse_dat(f'{args.path}/{args.vasp}', cache=not args.no_cache)
+        l = args.kernel.split(',')
+        kernel, mid, width = l[0], float(l[1]), float(l[2])
+        logger.info(f'Evaluating {len(args.batch)} Wannier90 runs')
+        rank_df = rank_runs(vkk, vee, args.batch, kernel=kernel, mid=mid, width=width,
+                            workers=args.workers, cache=not args.no_cache)
+        failed = rank_df.pop('error')
+        for i, error in failed[failed != ''].items():
+            logger.warning(f'{rank_df["run"][i]}: {error}')
+        with pd.option_context('display.max_rows', None, 'display.max_columns', None, 'display.width', 200):
+            logger.info(f'=== Runs ranked by average dE (meV) and spread (Ang^2) ===\n{rank_df}')
+        rank_df.to_csv(f'{args.path}/{name}_batch_rank.dat', sep=' ', float_format='%.6f', na_rep='nan', index_label='rank')
+        logger.info(f'Output ranking: {args.path}/{name}_batch_rank.dat')
+
+        if not args.no_plot:
+            for wdir in rank_df['run'][failed == ''][:args.top]:
+                wkk, wee = parse_dat(f'{wdir}/wannier90_band.dat', cache=not args.no_cache)
+                plot_cmp_vasp_w90(vkk, vee, wkk, wee,
+                                  ylim=args.ylim,
+                                  efermi=efermi,
+                                  font=args.fontfamily, size=args.fontsize,
+                                  labelinfo=f'{wdir}/wannier90_band.labelinfo.dat',
+                                  output=f'{wdir}/{name}_VASP_W90_cmp.png')
+    else:
+        logger.info(f'Reading Data from {args.path}/{args.vasp}')
+        vkk, vee = parse_dat(f'{args.path}/{args.vasp}', cache=not args.no_cache)
+        if args.hr:
+            # Wannier90 bands on the VASP k-points from the tight-binding Hamiltonian
+            logger.info(f'Interpolating bands from {args.path}/{args.hr} on k-points of {args.path}/vasprun.xml')
+            kpts = calc.vasprun('kpoints').kpoints
+            if len(kpts) != len(vkk):
+                raise ValueError(f'{len(kpts)} k-points in vasprun.xml but {len(vkk)} in {args.vasp}.')
+            wee = WannierHR(args.hr, path=args.path, cache=not args.no_cache).eigenvalues(kpts).T
+            wkk = vkk / (2 * np.pi)     # same unit as `wannier90_band.dat`
+        else:
+            wkk, wee = parse_dat(f'{args.path}/wannier90_band.dat', cache=not args.no_cache)
+
+        if not args.no_plot:
+            plot_cmp_vasp_w90(vkk, vee, wkk, wee, 
+                              ylim=args.ylim,
+                              efermi=efermi,
+                              font=args.fontfamily, size=args.fontsize,
+                              labelinfo=f'{args.path}/wannier90_band.labelinfo.dat')
+
+        if not args.no_quality and not args.quiet:
+            logger.info('Evaluating Band Quality:')
+            l = args.kernel.split(',')
+            kernel, mid, width = l[0], float(l[1]), float(l[2])
+            dEs, wgts = evaluate_cmp_vasp_w90(vkk, vee, wkk, wee,
+                                              kernel=kernel, mid=mid, width=width)
+            show_vasp_w90_diff(dEs, wgts)
+
+        if not args.no_spread and not args.quiet:
+            logger.info('Show spreading convergence:')
+            show_spreading(args.path)
 
     if args.show_fonts:
         show_all_fonts()
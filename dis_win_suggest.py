@@ -1,78 +1,145 @@
 import numpy as np
-import pandas as pd
-import os, re
-import matplotlib.pyplot as plt
-import sys
+import re
 import argparse
 
+from vasprun_reader import read_efermi
+from w90cache import load_cache, save_cache
+from calculation import Calculation
+from profiler import PROFILER, profiled
+
+@profiled
+def parse_eigenval(fname):
+    '''
+    Bulk parser of VASP EIGENVAL file.
+
+    The file is read once as bytes. After the 6 header lines, the whole numeric
+    block is converted in one pass and reshaped with the header-derived shape
+    (nkpts, 4 + nbnds * ncol), where `ncol` is 3 for ISPIN=1 and 5 for ISPIN=2.
+
+    Return: nspin, nelect, kpath (nkpts, 3), kptwt (nkpts,), ebands (nspin, nkpts, nbnds)
+    '''
+    with open(fname, 'rb') as f:
+        raw = f.read()
+
+    # extract the needed info in the header (first 6 non-empty lines).
+    header, pos = [], 0
+    while len(header) < 6:
+        end = raw.index(b'\n', pos)
+        if raw[pos:end].strip():
+            header.append(raw[pos:end])
+        pos = end + 1
+    nspin = int(header[0].split()[-1])
+    nelect, nkpts, nbnds = map(int, header[5].split())
+
+    # k-point line: kx ky kz weight, band line: index, energies, occupations
+    data = np.fromstring(raw[pos:].decode(), sep=' ')
+    block = data.size // nkpts
+    ncol, rest = divmod(block - 4, nbnds)
+    if block * nkpts != data.size or rest != 0 or ncol < nspin + 1:
+        raise ValueError(f'Cannot parse {fname}: {data.size} numbers for {nkpts} kpoints and {nbnds} bands.')
+    data.shape = (nkpts, block)
+
+    kpath = data[:, :3].copy()
+    kptwt = data[:, 3].copy()
+    ebands = data[:, 4:].reshape(nkpts, nbnds, ncol)[:, :, 1:nspin+1]
+    ebands = np.ascontiguousarray(ebands.transpose(2, 0, 1))
+    return nspin, nelect, kpath, kptwt, ebands
+
+@profiled
+def parse_eig(fname):
+    '''
+    Bulk parser of Wannier90 .eig file with lines of `band_id kpoint_id energy`.
+
+    Return: ebands (1, nkpts, nbnds)
+    '''
+    with open(fname, 'rb') as f:
+        data = np.fromstring(f.read().decode(), sep=' ')
+    data.shape = (-1, 3)
+    nkpts, nbnds = int(data[:, 1].max()), int(data[:, 0].max())
+    return data[:, 2].reshape((1, nkpts, nbnds))
+
+# arrays of the parsed band energies kept in the binary cache
+EIG_ARRAYS = ['ir_ebands', 'ir_kpath', 'ir_kptwt']
+# spin channels of ISPIN=2
+SPIN_NAMES = ['up', 'down']
+
+@profiled
+def load_eigenval(fname, cache=True):
+    '''
+    Band energies from VASP EIGENVAL file or Wannier90 .eig file, as a dict of
+    nspin, nelect, ir_kpath, ir_kptwt and ir_ebands (nspin, nkpts, nbnds).
+    The arrays are memory mapped from the binary cache if it is up to date.
+    '''
+    data = load_cache(fname) if cache else None
+    if data is None:
+        if fname[-3:] == 'eig':
+            data = {'nspin': 1, 'nelect': None, 'ir_kpath': None, 'ir_kptwt': None,
+                    'ir_ebands': parse_eig(fname)}
+        else:
+            nspin, nelect, kpath, kptwt, ebands = parse_eigenval(fname)
+            data = {'nspin': nspin, 'nelect': nelect, 'ir_kpath': kpath, 'ir_kptwt': kptwt,
+                    'ir_ebands': ebands}
+        if cache:
+            save_cache(fname, data, EIG_ARRAYS)
+    return data
+
 class W90():
-    def __init__(self, eig='EIGENVAL', path='.', win='wannier90.win', efermi=None, nbnds_excl=None, nwann=None, ndeg=1):
+    def __init__(self, eig='EIGENVAL', path='.', win='wannier90.win', efermi=None, nbnds_excl=None, nwann=None, ndeg=1, cache=True, calc=None):
         '''
-        Init
+        Init. With a `Calculation` `calc`, its band energies are used instead of reading
+        `{path}/{eig}` again, and its Fermi level if `efermi` is None.
         '''
-        self._fname = eig
+        self.calc = calc if calc else Calculation(path, eig, cache=cache)
+        self._fname = self.calc.eig
         self._win = win
         # the directory containing the input file
-        self._dname = path
+        self._dname = self.calc.path
         # if poscar is None:
         #     self.poscar = self._dname + '/POSCAR'
-        self.efermi = efermi
+        self.efermi = efermi if efermi is not None or calc is None else calc.efermi
         self.nbnds_excl = nbnds_excl
         self.nwann = nwann
         self.ndeg = ndeg # denegeracy of bands, actually only Kramers degeneracy counts
+        self.cache = self.calc.cache # use binary cache of parsed band energies next to the input file
 
         self.read_eigenval()
 
         # if os.path.isfile(self._win):
         #     self.read_wannier90_win()
 
+    @profiled
     def read_eigenval(self):
         '''
-        Read band energies from VASP EIGENVAL file or Wannier90 .eig file.
+        Read band energies from VASP EIGENVAL file or Wannier90 .eig file,
+        once per `Calculation`.
         '''
-        if self._fname[-3:] == 'eig':
-            self.nspin = 1
-            self.nelect = None
-            data = np.loadtxt(f'{self._dname}/{self._fname}')
-            self.ir_kpath = None
-            self.ir_kptwt = None
-            self.ir_nkpts = int(data[:, 1].max())
-            self.nbnds = int(data[:, 0].max())
-            self.ir_ebands = data[:, 2].reshape((self.ir_nkpts, 1, -1)).swapaxes(0, 1)
-        else:
-            with open(f'{self._dname}/{self._fname}') as inp:
-                # read all the data.
-                dat = np.array([line.strip() for line in inp if line.strip()])
-
-            # extract the needed info in the header.
-            self.nspin = int(dat[0].split()[-1])
-            self.nelect, self.ir_nkpts, self.nbnds = map(int, dat[5].split())
-
-            # remove the header
-            dat = dat[6:]
-
-            # extract the k-points info
-            dump = np.array(
-                [xx.split() for xx in dat[::self.nspin * self.nbnds + 1]], dtype=float)
-            self.ir_kpath = dump[:self.ir_nkpts, :3]
-            self.ir_kptwt = dump[:self.ir_nkpts, -1]
-
-            # extract the ebands info
-            ebands_flag = np.ones(dat.size, dtype=bool)
-            ebands_flag[::self.nspin * self.nbnds + 1] = 0
-            if self.nspin == 1:
-                ebands = np.array([xx.split()[1] for xx in dat[ebands_flag]],
-                                    dtype=float)
-            else:
-                ebands = np.array([xx.split()[1:3] for xx in dat[ebands_flag]],
-                                    dtype=float)
-            ebands.shape = (self.ir_nkpts, self.nspin, self.nbnds)
-            self.ir_ebands = ebands.swapaxes(0, 1)
+        data = self.calc.eigenval
+        self.nspin, self.nelect = data['nspin'], data['nelect']
+        self.ir_kpath, self.ir_kptwt, self.ir_ebands = data['ir_kpath'], data['ir_kptwt'], data['ir_ebands']
+        _, self.ir_nkpts, self.nbnds = self.ir_ebands.shape
 
         self.emax = self.ir_ebands.max()
         self.emin = self.ir_ebands.min()
-        self.eband_max = np.max(self.ir_ebands, axis=1)[0]
-        self.eband_min = np.min(self.ir_ebands, axis=1)[0]
+        # band edges of all spin channels (nspin, nbnds), each table in one pass over the bands
+        self.eband_max_spin = np.max(self.ir_ebands, axis=1)
+        self.eband_min_spin = np.min(self.ir_ebands, axis=1)
+        # running maximum of band edges, sorted even if bands cross, so the first band with
+        # `eband_max >= e` (or `eband_min > e`) can be found by `np.searchsorted`
+        self.eband_max_sorted_spin = np.maximum.accumulate(self.eband_max_spin, axis=1)
+        self.eband_min_sorted_spin = np.maximum.accumulate(self.eband_min_spin, axis=1)
+        # interval index of the band energy ranges [eband_min, eband_max] for `count_states`
+        self.eband_min_index_spin = np.sort(self.eband_min_spin, axis=1)
+        self.eband_max_index_spin = np.sort(self.eband_max_spin, axis=1)
+        self.select_spin(0)
+
+    def select_spin(self, spin):
+        '''
+        Use the band edges of spin channel `spin` (0: up, 1: down of ISPIN=2) in the queries.
+        '''
+        self.spin = spin
+        self.eband_max, self.eband_min = self.eband_max_spin[spin], self.eband_min_spin[spin]
+        self.eband_max_sorted, self.eband_min_sorted = self.eband_max_sorted_spin[spin], self.eband_min_sorted_spin[spin]
+        self.eband_min_index, self.eband_max_index = self.eband_min_index_spin[spin], self.eband_max_index_spin[spin]
 
     def read_wannier90_win(self):
         '''
@@ -98,7 +165,10 @@ class W90():
             if r:
                 self.win_min = eval(r.group(1))
 
+    @profiled
     def plot_eigenval(self, erange=None, separate=False, savefig='eigenval_dis.png'):
+        import matplotlib.pyplot as plt
+
         fig, ax = plt.subplots(figsize=(8, 6))
 
         def label_bar(string, height, rect):
@@ -143,6 +213,7 @@ class W90():
         plt.savefig(savefig, dpi=200, bbox_inches='tight', transparent=True)
         # plt.show()
 
+    @profiled
     def report_eigenval(self, erange=None, separate=False):
         print(f'EFERMI: {self.efermi: 2.6f}')
         print('--------------------------------')
@@ -175,53 +246,85 @@ class W90():
                     print(f'  {i:3d}    {emin:+10.5f}  {emax:+10.5f}')
         print('--------------------------------')
     
-    def count_states(self, erange):
-        emin, emax = erange
-        mask = np.logical_and(self.eband_min <= emax, self.eband_max >= emin)
-        return sum(mask)
+    @profiled
+    def count_states(self, erange, spin=None):
+        '''
+        Number of bands overlapping energy range `erange` = (emin, emax), or an array of
+        ranges with shape (n, 2) counted at once.
+        Bands of the selected spin channel, of channel `spin`, or of every channel
+        with `spin='both'`, which returns an array with a leading axis of nspin.
+
+        A band overlaps [emin, emax] unless it lies fully above emax or fully below emin,
+        so each count takes two binary searches in the sorted band edges.
+        '''
+        if spin == 'both':
+            return np.stack([self.count_states(erange, spin=s) for s in range(self.nspin)])
+        spin = self.spin if spin is None else spin
+        erange = np.asarray(erange, dtype=float)
+        emin = np.minimum(erange[..., 0], erange[..., 1])
+        emax = np.maximum(erange[..., 0], erange[..., 1])
+        res = np.searchsorted(self.eband_min_index_spin[spin], emax, side='right') \
+            - np.searchsorted(self.eband_max_index_spin[spin], emin, side='left')
+        return res[()]
 
     def suggest_win_max(self, emin, nwann=None, eps=4e-3):
         '''
-        Lower bound of dis_win_max for given froz_min and nwann
+        Lower bound of dis_win_max for given froz_min and nwann. `emin` can be an array.
         '''
         nwann = nwann if nwann else self.nwann
-        mask = self.eband_min >= emin
-        idx = np.argmax(mask) + nwann - 1
-        if idx >= self.nbnds:
+        idx = self.first_band(self.eband_min_sorted, emin, 'left') + nwann - 1
+        if np.ndim(idx) == 0 and idx >= self.nbnds:
             # TODO handle error case for no enough states
             print(f'There is no enough states for {emin} with {nwann} WFs!')
-            res = int(self.emax) + 1.
-        else:
-            res = self.eband_max[idx] + eps
-        return res
+        res = np.where(idx >= self.nbnds, int(self.emax) + 1., self.eband_max[np.minimum(idx, self.nbnds - 1)] + eps)
+        return res[()]
+
+    def first_band(self, edges, e, side):
+        '''
+        Index of the first band with edge >= e (side='left') or > e (side='right') for
+        sorted `edges`. 0 if there is no such band, the same as `np.argmax` of the mask.
+        '''
+        idx = np.searchsorted(edges, e, side=side)
+        return np.where(idx == self.nbnds, 0, idx)
 
     def suggest_froz_min(self, emax, nwann=None, eps=4e-3):
         '''
-        Lower bound of froz_min for given froz_max and nwann
+        Lower bound of froz_min for given froz_max and nwann. `emax` and `nwann` can be arrays.
         '''
-        nwann = nwann if nwann else self.nwann
-        mask_emax = self.eband_min <= emax
-        idx = np.argmin(mask_emax) - nwann - 1
-        res = int(self.emin) - 1. if idx < 0 else self.eband_max[idx] + eps
-        return res
+        nwann = self.nwann if nwann is None else np.where(nwann, nwann, self.nwann)
+        idx = self.first_band(self.eband_min_sorted, emax, 'right') - nwann - 1
+        res = np.where(idx < 0, int(self.emin) - 1., self.eband_max[np.maximum(idx, 0)] + eps)
+        return res[()]
 
     def suggest_froz_max(self, emin, nwann=None, eps=4e-3):
         '''
-        Upper bound of froz_max for given froz_min and nwann
+        Upper bound of froz_max for given froz_min and nwann. `emin` and `nwann` can be arrays.
         '''
-        nwann = nwann if nwann else self.nwann
-        mask_emin = self.eband_max >= emin
-        idx = np.argmax(mask_emin) + nwann
-        res = int(self.emax) + 1. if idx >= self.nbnds else self.eband_min[idx] - eps
-        return res
+        nwann = self.nwann if nwann is None else np.where(nwann, nwann, self.nwann)
+        idx = self.first_band(self.eband_max_sorted, emin, 'left') + nwann
+        res = np.where(idx >= self.nbnds, int(self.emax) + 1., self.eband_min[np.minimum(idx, self.nbnds - 1)] - eps)
+        return res[()]
 
-    def get_dis_froz_df(self, erange, eps=4e-3):
+    @profiled
+    def get_dis_froz_df(self, erange, eps=4e-3, spin=None):
         # suggest frozen window with given energy interval
+        # of the selected spin channel, of channel `spin`, or of both channels with a `spin` column
+        import pandas as pd
+
+        if spin is not None:
+            current, dfs = self.spin, []
+            for s in range(self.nspin) if spin == 'both' else [spin]:
+                self.select_spin(s)
+                if self.nspin == 2:
+                    print(f'Spin {SPIN_NAMES[s]}:')
+                dfs.append(self.get_dis_froz_df(erange, eps=eps).assign(spin=SPIN_NAMES[s] if self.nspin == 2 else s))
+            self.select_spin(current)
+            return pd.concat(dfs, ignore_index=True)
+
         N = self.count_states(erange)
         print(f'There are {N} states in {erange} with Fermi level at {self.efermi}.')
         emin, emax = erange
         dN = N - self.nwann
-        froz_min_list, froz_max_list = [], []
 
         if self.nwann <= 0:
             print(f'Please input vaild number of WF, now is {self.nwann}.')
@@ -231,44 +334,91 @@ class W90():
             print('Suggest dis_froz_min & dis_froz_max as following:')
             print(f'nwann: {self.nwann}    degenercy: {self.ndeg}    Fermi: {self.efermi:12.6f}')
 
-            for i in range(1, dN + 1, self.ndeg):
-                # First get froz_max for nwann = nwann_input + i, then get froz_min for nwann = nwann_input and froz_max
-                froz_max = self.suggest_froz_max(emin, nwann=self.nwann+i, eps=eps)
-                froz_min = self.suggest_froz_min(froz_max, eps=eps)
-                froz_max_list.append(froz_max)
-                froz_min_list.append(froz_min)
+            # First get froz_max for nwann = nwann_input + i, then get froz_min for nwann = nwann_input and froz_max
+            i = np.arange(1, dN + 1, self.ndeg)
+            froz_max = self.suggest_froz_max(emin, nwann=self.nwann+i, eps=eps)
+            froz_min = self.suggest_froz_min(froz_max, eps=eps)
 
             # number of missing states between `emin` and lowest `dis_froz_min`
-            num_missing = self.count_states((emin, min(froz_min_list)))
-            df = pd.DataFrame(zip(froz_min_list, froz_max_list), columns=['dis_froz_min', 'dis_froz_max'])
+            num_missing = self.count_states((emin, froz_min.min()))
 
             if num_missing > 0:
-                print(f'\nWANRING: There are states between given `emin`: {emin} and lowest `dis_froz_min`: {min(froz_min_list)}. Please carefully treat the suggestion of dis_froz_min / dis_froz_max and check energy range of each bands again. This situation usually happens in no-SOC system with many denegeracy point. But we still want to give you some useful energy window information with states less than number of WFs.\n')
-                for i in range(self.nwann - num_missing + 1, self.nwann, 1):
-                    new = pd.DataFrame({"dis_froz_min" : emin,
-                                        "dis_froz_max" : self.suggest_froz_max(emin, nwann=i)}, index=[1])
-                    df = df.append(new, ignore_index=True)
+                print(f'\nWANRING: There are states between given `emin`: {emin} and lowest `dis_froz_min`: {froz_min.min()}. Please carefully treat the suggestion of dis_froz_min / dis_froz_max and check energy range of each bands again. This situation usually happens in no-SOC system with many denegeracy point. But we still want to give you some useful energy window information with states less than number of WFs.\n')
+                i = np.arange(self.nwann - num_missing + 1, self.nwann)
+                froz_max = np.concatenate([froz_max, self.suggest_froz_max(emin, nwann=i)])
+                froz_min = np.concatenate([froz_min, np.full(len(i), float(emin))])
 
-            return df
+            return pd.DataFrame({'dis_froz_min': froz_min, 'dis_froz_max': froz_max})
         else:
             return pd.DataFrame(columns=['dis_froz_min', 'dis_froz_max'])
 
-def get_efermi(args, direct=False):
+    @profiled
+    def optimize_windows(self, erange, step=0.1, score=None, top=20, chunk=4096):
+        '''
+        Search dis_win_min <= dis_froz_min < dis_froz_max <= dis_win_max on the energy
+        grid of `step` inside `erange`.
+
+        Frozen windows are kept if they contain 1 ~ nwann states in multiples of ndeg.
+        Since the outer window doesn't change the score, only the narrowest outer window
+        is kept for each frozen window: dis_win_min on the grid below dis_froz_min, and
+        dis_win_max the larger of dis_froz_max and `suggest_win_max(dis_win_min)`.
+        Candidates are ranked by `score(froz_min, froz_max)` (default: frozen states / nwann)
+        and then by the width of the outer window.
+        '''
+        import pandas as pd
+
+        e = np.arange(erange[0], erange[1] + step / 2, step)
+        froz = grid_ranges(erange, step)
+        nfroz = self.count_states(froz)
+        mask = (nfroz > 0) & (nfroz <= self.nwann) & (nfroz % self.ndeg == 0)
+        froz, nfroz = froz[mask], nfroz[mask]
+
+        # lowest dis_win_max for every dis_win_min on the grid
+        win_max_low = self.suggest_win_max(e)
+        win_min, win_max = np.empty(len(froz)), np.empty(len(froz))
+        for start in range(0, len(froz), chunk):
+            fmin, fmax = froz[start:start+chunk].T
+            wmax = np.maximum(fmax[:, None], win_max_low)
+            width = np.where(e <= fmin[:, None] + step / 2, wmax - e, np.inf)
+            g = np.argmin(width, axis=1)
+            win_min[start:start+chunk] = e[g]
+            win_max[start:start+chunk] = wmax[np.arange(len(g)), g]
+        nwin = self.count_states(np.column_stack([win_min, win_max]))
+
+        df = pd.DataFrame({'dis_win_min': win_min, 'dis_froz_min': froz[:, 0],
+                           'dis_froz_max': froz[:, 1], 'dis_win_max': win_max,
+                           'nfroz': nfroz, 'nwin': nwin,
+                           'score': score(froz[:, 0], froz[:, 1]) if score else nfroz / self.nwann})
+        df = df[df['nwin'] >= self.nwann]
+        df = df.assign(width=df['dis_win_max'] - df['dis_win_min'])
+        df = df.sort_values(['score', 'width'], ascending=[False, True])
+        return df.drop(columns='width').head(top).reset_index(drop=True)
+
+def grid_ranges(erange, step):
+    '''
+    All energy ranges (emin, emax) with emin < emax and both ends on the grid
+    of `step` inside `erange`. Return (n, 2) array.
+    '''
+    e = np.arange(erange[0], erange[1] + step / 2, step)
+    i, j = np.triu_indices(len(e), k=1)
+    return np.column_stack([e[i], e[j]])
+
+def get_efermi(args, direct=False, calc=None):
     if not direct and args.efermi:
-        efermi = float(args.efemri)
+        efermi = float(args.efermi)
+    elif calc:
+        efermi = calc.efermi
     else:
-        efermi_str = os.popen(f'grep fermi {args.path}/vasprun.xml').read().strip()
-        m = re.match('.+ ((\-|\+)?\d+(\.\d+)?) .+', efermi_str)
-        efermi = float(m.groups()[0])
+        efermi = read_efermi(f'{args.path}/vasprun.xml')
     return efermi
 
-def get_args():
+def get_args(argv=None):
     '''
     CML parser.
     '''
-    parser = argparse.ArgumentParser(description='CLI Tool for W90 energy windows.', add_help=True)
+    parser = argparse.ArgumentParser(prog='dis_win_suggest.py', description='CLI Tool for W90 energy windows.', add_help=True)
 
-    parser.add_argument('mode', help='Mode: report, plot, count, suggest')
+    parser.add_argument('mode', help='Mode: report, plot, count, suggest, optimize')
     parser.add_argument('-i', dest='eig', action='store', type=str,
                         default='EIGENVAL',
                         help='Select wannier90.eig file or EIGENVAL file. Default: EIGENVAL')
@@ -291,25 +441,57 @@ def get_args():
                         help='Energy range.')
     parser.add_argument('--separate', default=False, action="store_true",
                         help='Calculate bands not separately.')
-    return parser.parse_args()
-
-if __name__ == "__main__":
-    args = get_args()
-
-    w90 = W90(eig=args.eig,
-              path=args.path,
-              efermi=get_efermi(args), 
-              nbnds_excl=args.nbnds_excl, 
-              nwann=args.nwann, 
-              ndeg=args.ndeg)
-
+    parser.add_argument('--ranges', default=None,
+                        help='File of energy ranges with `emin emax` in each line to count states in `count` mode.')
+    parser.add_argument('--grid', default=None, type=float,
+                        help='Energy step. Count states of all ranges on the energy grid inside `-e` in `count` mode.')
+    parser.add_argument('--step', default=0.1, type=float,
+                        help='Energy step of the window search in `optimize` mode. Default: 0.1')
+    parser.add_argument('--top', default=20, type=int,
+                        help='Number of best windows to print in `optimize` mode. Default: 20')
+    parser.add_argument('--extra', default='',
+                        help="Selected orbitals as in `pre_w90_tool.py`, e.g. 'Ga,0,1-3;As,1,1-3'. `optimize` mode ranks windows by their PDOS / TDOS in frozen window from `vasprun.xml`.")
+    parser.add_argument('--no-cache', default=False, action="store_true",
+                        help='Neither read nor write the binary cache `.{EIG}.w90cache` of parsed band energies.')
+    parser.add_argument('--spin', default='both', choices=['up', 'down', 'both'],
+                        help='Spin channels of ISPIN=2 calculation. Default: both')
+    parser.add_argument('--profile', default=None, nargs='?', const='', metavar='FILE',
+                        help='Print wall time and calls of each stage at exit. With FILE, also dump a JSON trace (*.json) or cProfile statistics (other names).')
+    parser.add_argument('--profile-mem', default=False, action="store_true",
+                        help='Also trace the peak memory of each stage with tracemalloc, with or without --profile. It slows down allocations, so the times are larger than without it.')
+    args = parser.parse_args(argv)
+    if args.grid and args.erange is None:
+        parser.error('--grid needs -e EMIN EMAX')
+    return args
+
+def run(args, w90):
+    '''
+    Run `args.mode` on the loaded `w90` for each spin channel of `--spin`. Its `Calculation`
+    also gives the PDOS of `--extra`. `w90server.py` calls it with the `W90` of its cached `Calculation`.
+    '''
+    spins = [0] if w90.nspin == 1 else {'up': [0], 'down': [1], 'both': [0, 1]}[args.spin]
+    for spin in spins:
+        w90.select_spin(spin)
+        if w90.nspin == 2:
+            print(f'========== Spin {SPIN_NAMES[spin]} ==========')
+        run_channel(args, w90)
+    w90.select_spin(0)
+
+def run_channel(args, w90):
     if args.mode[0].lower() == 'p': # plot
-        w90.plot_eigenval(erange=args.erange, separate=args.separate)
+        savefig = 'eigenval_dis.png' if w90.nspin == 1 else f'eigenval_dis_{SPIN_NAMES[w90.spin]}.png'
+        w90.plot_eigenval(erange=args.erange, separate=args.separate, savefig=savefig)
     elif args.mode[0].lower() == 'r': # report
         w90.report_eigenval(erange=args.erange, separate=args.separate)
     elif args.mode[0].lower() == 'c': # count
         # Count how many states inside the energy interval
-        print(f'There are {w90.count_states(args.erange)} states in {args.erange}.')
+        if args.ranges or args.grid:
+            ranges = np.loadtxt(args.ranges, ndmin=2)[:, :2] if args.ranges else grid_ranges(args.erange, args.grid)
+            import pandas as pd
+            df = pd.DataFrame({'emin': ranges[:, 0], 'emax': ranges[:, 1], 'nstates': w90.count_states(ranges)})
+            print(df.to_string(index=False))
+        else:
+            print(f'There are {w90.count_states(args.erange)} states in {args.erange}.')
     elif args.mode[0].lower() == 's': # suggest
         # suggest frozen window with given energy interval
         print(f'`dis_froz_min` and `dis_froz_max` Table:')
@@ -319,6 +501,28 @@ if __name__ == "__main__":
         # dis_windows require energy window containing states larger than number of target WFs. This will also generate some constraint for dis_windows
         dis_win_max = w90.suggest_win_max(args.erange[0])
         print(f'\nLowest `dis_win_max` for {args.erange[0]}: {dis_win_max}')
+    elif args.mode[0].lower() == 'o': # optimize
+        # search all of dis_win_min, dis_froz_min, dis_froz_max, dis_win_max inside the energy interval
+        score = None
+        if args.extra:
+            from pre_w90_tool import select_str2list
+            index = w90.calc.dos_index(select_str2list(args.extra), spin=w90.spin)
+            score = lambda fmin, fmax: index.score(fmin, fmax)[2]
+        print(f'nwann: {w90.nwann}    degenercy: {w90.ndeg}    Fermi: {w90.efermi:12.6f}')
+        print(w90.optimize_windows(args.erange, step=args.step, score=score, top=args.top))
 
     else:
-        print(f'Unsupported mode: {args.mode}')
\ No newline at end of file
+        print(f'Unsupported mode: {args.mode}')
+
+if __name__ == "__main__":
+    args = get_args()
+    if args.profile is not None or args.profile_mem:
+        PROFILER.start(args.profile, memory=args.profile_mem)
+
+    calc = Calculation(args.path, args.eig, cache=not args.no_cache, vasprun=('pdos',) if args.extra else ())
+    w90 = W90(calc=calc,
+              efermi=get_efermi(args, calc=calc), 
+              nbnds_excl=args.nbnds_excl, 
+              nwann=args.nwann, 
+              ndeg=args.ndeg)
+    run(args, w90)
@@ -1,169 +1,196 @@
 #!/usr/bin/env python
 # -*- coding=utf-8 -*-
-
 import sys
+import json
+import argparse
 import numpy as np
 
-import matplotlib.pyplot as plt
-
-from pymatgen.io.vasp.outputs import Vasprun
-from pymatgen.electronic_structure.core import Spin, Orbital
+from calculation import Calculation
+from profiler import PROFILER, profiled
 
-from scipy.ndimage import gaussian_filter1d as gaussian
-
-import matplotlib
-matplotlib.use('Agg')
+# color from https://color.adobe.com/zh/create/color-wheel
+BASE_COLORS = ['#E0AC09', '#F72916', '#6938E0', '#1C00BF', '#00FF00']
 
 def hex2rgb(hexcode):
     return tuple([int(hexcode[2*i+1:2*i+3], 16) for i in range(3)])
 
-def orbstring2py(orb):
-    orb_names = ['s', 'py', 'pz', 'px', 'dxy', 'dyz', 'dz2', 'dxz', 'dx2']
-    idx = 0
-    for i, orb_name in enumerate(orb_names):
-        if orb_name == orb:
-            idx = i
-    return Orbital(idx)
+def orbstring2list(orb, orb_names):
+    '''
+    Orbital names of `orb`: a single orbital (`pz`), a shell (`p` for `py`, `pz`, `px`),
+    `all`, or several of them joined with `+`.
+    '''
+    res = []
+    for o in orb.split('+'):
+        names = orb_names if o == 'all' else [n for n in orb_names if n == o or (len(o) == 1 and n[0] == o)]
+        if not names:
+            raise ValueError(f'Unknown orbital `{o}`. The orbitals in vasprun.xml are {orb_names}.')
+        res += names
+    return res
+
+def sitestring2list(sites, structure):
+    '''
+    Structure indices of `sites`: species names and indices or ranges separated with comma,
+    e.g. `Ga`, `0,2-5` or `Ga,7`.
+    '''
+    res = []
+    for s in sites.split(','):
+        if s[0].isdigit():
+            l, r = map(int, s.split('-')) if '-' in s else [int(s)] * 2
+            res += list(range(l, r + 1))
+        else:
+            idx = [i for i, site in enumerate(structure) if site.species_string == s]
+            if not idx:
+                raise ValueError(f'There is no `{s}` in the structure.')
+            res += idx
+    return res
+
+def parse_groups(groups, structure, orb_names):
+    '''
+    Curves of the `SITES:ORBITALS[:LABEL]` strings of `--group`. Every orbital separated with
+    comma in ORBITALS is one curve, e.g. `Ga:s,p` gives `Ga-s` and `Ga-p` while `Ga:s+p` gives
+    one curve of both.
+
+    Return: [(label, site indices, orbital names), ...]
+    '''
+    res = []
+    for group in groups:
+        sites, orbs, *label = group.split(':')
+        site_list = sitestring2list(sites, structure)
+        for orb in orbs.split(','):
+            name = label[0] if label and len(orbs.split(',')) == 1 else f'{label[0] if label else sites}-{orb}'
+            res.append((name, site_list, orbstring2list(orb, orb_names)))
+    return res
+
+@profiled
+def group_pdos(dos_data_total, curves, spin=0):
+    '''
+    Summed PDOS of `curves` from `parse_groups`. The site and orbital selections are turned into
+    (ncurves, nsites) and (ncurves, norb) masks, which reduce the (sites, orbitals, energies) PDOS
+    of all curves in one contraction.
+
+    Return: (ncurves, nedos)
+    '''
+    sites, orb_names = dos_data_total.pdos_sites, dos_data_total.orb_names
+    row = {s: i for i, s in enumerate(sites)}
+    site_mask = np.zeros((len(curves), len(sites)))
+    orb_mask = np.zeros((len(curves), len(orb_names)))
+    for i, (label, site_list, orbs) in enumerate(curves):
+        missing = [s for s in site_list if s not in row]
+        if missing:
+            raise ValueError(f'There is no PDOS of sites {missing} for `{label}` in vasprun.xml.')
+        site_mask[i, [row[s] for s in site_list]] = 1
+        orb_mask[i, [orb_names.index(o) for o in orbs]] = 1
+    return np.einsum('cs,co,soe->ce', site_mask, orb_mask, dos_data_total.pdos[:, :, spin], optimize=True)
+
+@profiled
+def broaden(energies, dos, sigma):
+    '''
+    Gaussian broadening of width `sigma` (eV) of all curves of `dos` (..., nedos) in one call.
+    '''
+    if sigma <= 0:
+        return dos
+    from scipy.ndimage import gaussian_filter1d
+    return gaussian_filter1d(dos, sigma / (energies[1] - energies[0]), axis=-1)
+
+@profiled
+def plot_dos(energies, tdos, pdos, labels, efermi=0, xlim=None, ymax=5, colors=BASE_COLORS,
+             font="Open Sans", size=24, filename='dos_plot_no_mag.png'):
+    import matplotlib as mpl
+    mpl.use('Agg')
+    import matplotlib.pyplot as plt
 
-if __name__ == "__main__":
-    # TODO Need to polish
     # set up matplotlib plot
     # ----------------------
-    plt.rcParams['font.family'] = "Open Sans"
+    plt.rcParams['font.family'] = font
     plt.rcParams['font.weight'] = "regular"
-    plt.rcParams['font.size'] = 24
+    plt.rcParams['font.size'] = size
 
     fig, ax = plt.subplots(figsize=(10, 5))
-
-    # set ylim for the plot
-    # ---------------------
-    emin  = -6
-    emax  =  10
-    sigma =  0.02
-    ymax  =  5
-
-    ax.set_xlim(emin, emax)
-
-    # Basic Orbital Information
-    # -------------------------
-    # test
-    is_index_given = True
-    el_orb_dict = { "0" : ["p"],        # separate with comma, e.g. "1,2,3,5": ["pz"]
-                    "1" : ["p"]}
-    labels = ["Ga-p", "As-p"]
-    base_colors = ['#E0AC09', '#F72916']
-    #
-    # is_index_given = False
-    # el_orb_dict = {"Ga": ["s", "p"], "As":["p"]}
-    # base_colors = ['#E0AC09', '#F72916', '#6938E0', '#1C00BF', '#00FF00']
-    # # color from https://color.adobe.com/zh/create/color-wheel
-
-    # Density of states
-    # -----------------
-
-    # read dos data
-    # -------------
-    dospath = '.'
-    dosrun = Vasprun(dospath + "/vasprun.xml")
-
-    ee = dosrun.tdos.energies
-    # get element_orbital_dos from site_orbital_dos
-    spec_orb_dos = {}
-    structure = dosrun.structures[0]
-    for species, orbs in el_orb_dict.items():
-        orb_dos = {}
-        for orb in orbs:
-            orb_py = orbstring2py(orb)
-            densities = np.zeros_like(ee)
-
-            if is_index_given == False:
-                for site in structure.sites:
-                    if site.species_string == species:
-                        if orb == 'p':
-                            densities += dosrun.complete_dos.pdos[site][orbstring2py('px')][Spin.up]
-                            densities += dosrun.complete_dos.pdos[site][orbstring2py('py')][Spin.up]
-                            densities += dosrun.complete_dos.pdos[site][orbstring2py('pz')][Spin.up]
-                        elif orb == 'd':
-                            densities += dosrun.complete_dos.pdos[site][orbstring2py('dxy')][Spin.up]
-                            densities += dosrun.complete_dos.pdos[site][orbstring2py('dyz')][Spin.up]
-                            densities += dosrun.complete_dos.pdos[site][orbstring2py('dz2')][Spin.up]
-                            densities += dosrun.complete_dos.pdos[site][orbstring2py('dxz')][Spin.up]
-                            densities += dosrun.complete_dos.pdos[site][orbstring2py('dx2')][Spin.up]
-                        else:
-                            densities += dosrun.complete_dos.pdos[site][orb_py][Spin.up]
-            else:
-                site_idx_list = [int(i) for i in species.split(',')]
-                for site_idx in site_idx_list:
-                    site = structure.sites[site_idx]
-                    if orb == 'p':
-                        densities += dosrun.complete_dos.pdos[site][orbstring2py('px')][Spin.up]
-                        densities += dosrun.complete_dos.pdos[site][orbstring2py('py')][Spin.up]
-                        densities += dosrun.complete_dos.pdos[site][orbstring2py('pz')][Spin.up]
-                    elif orb == 'd':
-                        densities += dosrun.complete_dos.pdos[site][orbstring2py('dxy')][Spin.up]
-                        densities += dosrun.complete_dos.pdos[site][orbstring2py('dyz')][Spin.up]
-                        densities += dosrun.complete_dos.pdos[site][orbstring2py('dz2')][Spin.up]
-                        densities += dosrun.complete_dos.pdos[site][orbstring2py('dxz')][Spin.up]
-                        densities += dosrun.complete_dos.pdos[site][orbstring2py('dx2')][Spin.up]
-                    else:
-                        densities += dosrun.complete_dos.pdos[site][orb_py][Spin.up]
-
-            orb_dos[orb] = densities
-        spec_orb_dos[species] = orb_dos
-
-    # ax.set_xticklabels([])
-    # ax.grid()
+    ax.set_xlim(*(xlim if xlim else (energies[0], energies[-1])))
     ax.set_ylim(1e-6, ymax)
-    # ax.set_xticklabels([])
-    ax.vlines(x=dosrun.efermi, ymin=0, ymax=ymax, color="grey", linestyles="dashed", lw=1)
+    ax.vlines(x=efermi, ymin=0, ymax=ymax, color="grey", linestyles="dashed", lw=1)
     ax.set_ylabel("DOS / a.u.")
     ax.set_xlabel("Energy / eV")
-    #ax.set_title("Density of States")
 
     # spd contribution
-    color_idx = 0
-    for species, orbs_dos in spec_orb_dos.items():
-        for orb, dos in orbs_dos.items():
-            # if gaussian
-            dos = gaussian(dos, sigma*len(ee)/(ee.max()-ee.min()))
-            if is_index_given == False:
-                ax.plot(ee,
-                        dos,
-                        color=base_colors[color_idx],
-                        label=f'{species}-{orb}', lw=2, zorder=30)
-            else:
-                ax.plot(ee,
-                        dos,
-                        color=base_colors[color_idx],
-                        label=labels[color_idx], lw=2, zorder=30)
-            color_idx += 1
+    for i, (dos, label) in enumerate(zip(pdos, labels)):
+        ax.plot(energies, dos, color=colors[i % len(colors)], label=label, lw=2, zorder=30)
 
     # total dos
-    dos = dosrun.tdos.densities[Spin.up]
-    # if gaussian
-    dos = gaussian(dos, sigma*len(ee)/(ee.max()-ee.min()))
-    ax.fill_between(ee,
-                    dos,
-                    color=(0.7, 0.7, 0.7),
-                    facecolor=(0.7, 0.7, 0.7))
-
-    ax.plot(ee,
-            dos,
-            color=(0.3, 0.3, 0.3),
-            label="total", zorder=10)
+    ax.fill_between(energies, tdos, color=(0.7, 0.7, 0.7), facecolor=(0.7, 0.7, 0.7))
+    ax.plot(energies, tdos, color=(0.3, 0.3, 0.3), label="total", zorder=10)
 
     # plot format style
     # -----------------
-    ax.tick_params(axis='both', direction='in', labelsize=20)
+    ax.tick_params(axis='both', direction='in', labelsize=size - 4)
     legend = ax.legend(fancybox=False,
-                        shadow=False,
-                        facecolor='white',
-                        edgecolor='black',
-                        loc='upper right', 
-                        framealpha=1.0, 
-                        frameon=True, #False,
-                        prop={'size': 20})
+                       shadow=False,
+                       facecolor='white',
+                       edgecolor='black',
+                       loc='upper right',
+                       framealpha=1.0,
+                       frameon=True,
+                       prop={'size': size - 4})
     legend.get_frame().set_linewidth(0)
+    plt.savefig(filename, format="png", bbox_inches='tight', dpi=150)
+    plt.close(fig)
+
+def get_args(argv=None):
+    '''
+    CML parser. The defaults can be given in the JSON file of `--config`, with the option names as keys.
+    '''
+    parser = argparse.ArgumentParser(prog='dos_plot_no_mag.py', description="Total and projected DOS of non-magnetic calculation.\n    python dos_plot_no_mag.py -g 'Ga:s,p' -g 'As:p' -e -6 10", add_help=True)
+    parser.add_argument('--config', default=None,
+                        help='JSON file of default options, e.g. {"group": ["0:p:Ga-p", "1:p:As-p"], "erange": [-6, 10]}')
+    parser.add_argument('--path', default='.',
+                        help='Default: .')
+    parser.add_argument('-g', '--group', dest='group', action='append', default=None,
+                        help='Curve(s) of summed PDOS: `SITES:ORBITALS[:LABEL]`. SITES are species and structure indices or ranges separated with comma (`Ga`, `0,2-5`). ORBITALS are orbitals or shells (`s`, `p`, `dz2`, `all`) separated with comma, one curve each, or joined with `+` in one curve. Can be repeated, and adds to the groups of `--config`.')
+    parser.add_argument('-e', dest='erange', action='store', type=float, default=None, nargs=2,
+                        help='Energy range of the plot. Default: range of vasprun.xml')
+    parser.add_argument('--ymax', default=5, type=float,
+                        help='Upper bound of DOS. Default: 5')
+    parser.add_argument('--sigma', default=0.02, type=float,
+                        help='Gaussian broadening (eV), 0 for none. Default: 0.02')
+    parser.add_argument('--colors', default=None, nargs='+',
+                        help=f'Colors of the curves of `--group`. Default: {" ".join(BASE_COLORS)}')
+    parser.add_argument('--fontfamily', default='Open Sans',
+                        help="Set font family manually. Default: Open Sans")
+    parser.add_argument('--fontsize', default=24, type=int,
+                        help="Set font size manually. Default: 24")
+    parser.add_argument('-o', '--output', default='dos_plot_no_mag.png',
+                        help='Output figure. Default: dos_plot_no_mag.png')
+    parser.add_argument('--profile', default=None, nargs='?', const='', metavar='FILE',
+                        help='Print wall time and calls of each stage at exit. With FILE, also dump a JSON trace (*.json) or cProfile statistics (other names).')
+    parser.add_argument('--profile-mem', default=False, action="store_true",
+                        help='Also trace the peak memory of each stage with tracemalloc, with or without --profile. It slows down allocations, so the times are larger than without it.')
+
+    args, _ = parser.parse_known_args(argv)
+    if args.config:
+        with open(args.config) as f:
+            parser.set_defaults(**json.load(f))
+    return parser.parse_args(argv)
+
+if __name__ == "__main__":
+    args = get_args()
+    if args.profile is not None or args.profile_mem:
+        PROFILER.start(args.profile, memory=args.profile_mem)
 
-    # plt.show()
-    plt.savefig(sys.argv[0].strip(".py") + ".png", format="png", bbox_inches='tight', dpi=150)
+    # read dos data
+    # -------------
+    calc = Calculation(args.path, vasprun=('structure', 'tdos', 'pdos'))
+    dosrun = calc.vasprun()
+    if args.group and dosrun.pdos is None:
+        print(f'There is no PDOS in `{args.path}/vasprun.xml`. Please set LORBIT = 11.', file=sys.stderr)
+        sys.exit(1)
+
+    curves = parse_groups(args.group or [], dosrun.structure, dosrun.orb_names or [])
+    ee = dosrun.energies
+    # total dos and all the spd contributions broadened together
+    dos = np.concatenate([dosrun.tdos[:1], group_pdos(dosrun, curves)]) if curves else dosrun.tdos[:1]
+    dos = broaden(ee, dos, args.sigma)
+
+    plot_dos(ee, dos[0], dos[1:], [c[0] for c in curves], efermi=calc.efermi, xlim=args.erange,
+             ymax=args.ymax, colors=args.colors or BASE_COLORS, font=args.fontfamily,
+             size=args.fontsize, filename=args.output)
+    print(f'DOS of {len(curves)} groups plotted in `{args.output}`')
@@ -1,60 +1,86 @@
-import matplotlib.pyplot as plt
 import numpy as np
-import pandas as pd
 import argparse
 import os
 
-# pymatgen
-from pymatgen.io.vasp.outputs import Vasprun
-from pymatgen import Orbital
-# spin
-from pymatgen import Spin
-
-# 计算在某一个能量区间范围内的占比
-# from scipy.interpolate import interp1d
-from scipy.interpolate import splrep, splev
-from scipy.integrate import fixed_quad
+from calculation import Calculation, vasprun_of
+from profiler import PROFILER, profiled
 
 from collections import Counter
 from functools import reduce
 
-import matplotlib
-matplotlib.use('Agg')
+# matplotlib and pandas are imported by the functions using them, so that
+# `kpath` and `template` modes start without loading them
 
+# 计算在某一个能量区间范围内的占比
 def dos_distribute(e, dos, window):
-    # dos_func = interp1d(e, dos, kind='nearest')
-    dos_cubic_fitting = splrep(e, dos, s=0)
-    dos_func = lambda x: splev(x, dos_cubic_fitting, der=0)
-    res = fixed_quad(dos_func, window[0], window[-1])
-    return res[0]
+    return window_dos(e, dos, cumulative_dos(e, dos), window)
+
+def cumulative_dos(e, dos):
+    '''
+    Cumulative integral of `dos` (..., nedos) over energy grid `e` (nedos,) with
+    trapezoid rule. It is the lookup table of `integral_to` for any energy window.
+    '''
+    cum = np.zeros_like(dos)
+    cum[..., 1:] = np.cumsum((dos[..., 1:] + dos[..., :-1]) * np.diff(e) / 2, axis=-1)
+    return cum
 
+def integral_to(e, dos, cum, x):
+    '''
+    Integral of piecewise linear `dos` (..., nedos) from e[0] to `x` (scalar or (nx,)),
+    interpolated from the cumulative table `cum`. Return (...) or (..., nx).
+    '''
+    i = np.clip(np.searchsorted(e, x) - 1, 0, len(e) - 2)
+    dx = x - e[i]
+    slope = (dos[..., i+1] - dos[..., i]) / (e[i+1] - e[i])
+    return cum[..., i] + dos[..., i] * dx + slope * dx**2 / 2
+
+def window_dos(e, dos, cum, window):
+    '''
+    Integral of `dos` (..., nedos) inside `window` for all leading axes at once.
+    window[0] and window[-1] can be scalars or arrays of many windows.
+    '''
+    return integral_to(e, dos, cum, window[-1]) - integral_to(e, dos, cum, window[0])
+
+@profiled
 def gen_dos_df(dos_data_total, left, right, orb_names=['s', 'py', 'pz', 'px', 'dxy', 'dyz', 'dz2', 'dxz', 'dx2']):
+    import pandas as pd
+
+    calc = dos_data_total if isinstance(dos_data_total, Calculation) else None
+    dos_data_total = vasprun_of(dos_data_total, 'structure', 'pdos')
     structure = dos_data_total.structure
-    num_sites = structure.num_sites
     ee = dos_data_total.energies
 
-    # TODO not fail the task but use `PROCAR` to generate a result, although it might not be accurate enough.
     if left < ee.min() or right > ee.max():
-        raise ValueError(f'CHECK YOUR INPUT! The energies in `EIGENVAL` is ranged from {ee.min()} to {ee.max()} which not include all the energy ranged from {left} to {right} you input.')
-
-    dos_df = pd.DataFrame(columns=["species", "structure_id", "orb_id", "orb_name", "key_string", "dos"])
-    for i in range(num_sites):
-        for j in range(len(orb_names)):
-            site, orb = structure[i], Orbital(j)
-            dos = dos_data_total.get_site_orbital_dos(site, orb)
-            dis = dos_distribute(ee, dos.densities[Spin.up], [left, right])
-            key = site.species_string + '_' + str(i) + '_' + orb_names[j]
-            new = pd.DataFrame({"species"      : site.species_string,
-                                "structure_id" : i,
-                                "orb_id"       : j,
-                                "orb_name"     : orb_names[j],
-                                "key_string"   : key,
-                                "dos"          : dis}, index=[1])
-            dos_df = dos_df.append(new, ignore_index=True)
+        # band projections of PROCAR instead, although they might not be accurate enough
+        if calc is None or not os.path.isfile(f'{calc.path}/PROCAR'):
+            raise ValueError(f'CHECK YOUR INPUT! The energies in `vasprun.xml` is ranged from {ee.min()} to {ee.max()} which not include all the energy ranged from {left} to {right} you input. Put `PROCAR` in the same folder to use the band projections instead.')
+        print(f'Energy range [{left}, {right}] is out of the DOS. Using band projections of `{calc.path}/PROCAR` instead.')
+        dis = calc.procar.window_weights(left, right, orb_names)
+        sites = list(range(len(dis)))
+    else:
+        # (sites, orbitals, energies) array of spin up PDOS, integrated once
+        sites = dos_data_total.pdos_sites
+        cols = [dos_data_total.orb_names.index(o) for o in orb_names]
+        pdos = dos_data_total.pdos[:, cols, 0]
+        dis = window_dos(ee, pdos, cumulative_dos(ee, pdos), [left, right])
+
+    norb = len(orb_names)
+    species = [structure[i].species_string for i in sites]
+    dos_df = pd.DataFrame({"species"      : np.repeat(species, norb),
+                           "structure_id" : np.repeat(sites, norb),
+                           "orb_id"       : np.tile(np.arange(norb), len(sites)),
+                           "orb_name"     : np.tile(orb_names, len(sites)),
+                           "key_string"   : [f'{s}_{i}_{o}' for s, i in zip(species, sites) for o in orb_names],
+                           "dos"          : dis.ravel()})
     dos_df['dos'] = dos_df['dos'] / max(dos_df['dos'])      # Renormalize
     return dos_df
 
+@profiled
 def plot_dos_dis(dos_df, pct=1, selected=set(), path='.', filename='dos_analysis.png', colors=['brown', 'orange']):
+    import matplotlib as mpl
+    mpl.use('Agg')
+    import matplotlib.pyplot as plt
+
     threshold = pct / 100 * dos_df['dos'].max()
     df = dos_df[dos_df['dos'] > threshold]
     df = df.sort_values(by='dos', ascending=False)
@@ -69,10 +95,33 @@ def plot_dos_dis(dos_df, pct=1, selected=set(), path='.', filename='dos_analysis
     plt.grid(axis='x')
     plt.savefig(filename, dpi=200, bbox_inches='tight', transparent=True)
 
+@profiled
+def plot_wannier_dos(energies, dos, efermi=0, vasp=None, filename='wannier_dos.png'):
+    '''
+    Wannier DOS, together with the VASP TDOS `vasp` = (energies, tdos) if given.
+    '''
+    import matplotlib as mpl
+    mpl.use('Agg')
+    import matplotlib.pyplot as plt
+
+    fig, ax = plt.subplots(figsize=(10, 5))
+    if vasp is not None:
+        ax.fill_between(vasp[0] - efermi, vasp[1], color=(0.7, 0.7, 0.7), label='VASP')
+    ax.plot(energies - efermi, dos, color='brown', label='Wannier90')
+    ax.set_xlim(energies[0] - efermi, energies[-1] - efermi)
+    ax.set_ylim(0, dos.max() * 1.1)
+    ax.set_xlabel('Energy / eV')
+    ax.set_ylabel('DOS / a.u.')
+    ax.legend(loc='upper right')
+    plt.savefig(filename, dpi=200, bbox_inches='tight', transparent=True)
+
 # 返回最终选择的 轨道数量 和 轨道列表, 以 pandas.DataFrame 的形式
 # 其中 site 如果为 -1, 意味着选择该元素的全体轨道
 # pick_rate 指选择的轨道成分为 0.1*max_dos
+@profiled
 def dos_analysis_df(dos_df, pick_rate=0.1):
+    import pandas as pd
+
     # 选择出满足条件的轨道
     threshold = pick_rate * dos_df['dos'].max()
     df = dos_df[dos_df['dos'] > threshold]
@@ -81,7 +130,7 @@ def dos_analysis_df(dos_df, pick_rate=0.1):
     n_orb = len(df)
 
     # 存储筛选结果数据表, 分为两个部分, site 和 orb
-    res_df = pd.DataFrame(columns=["species", "site", "orb"])
+    res_rows = []
 
     # 判断一个格点上是否同一类型的轨道都被选择了
     d_orb = ['dxy', 'dyz', 'dxz', 'dx2', 'dz2']
@@ -107,11 +156,9 @@ def dos_analysis_df(dos_df, pick_rate=0.1):
                     orb_list = d_orb
                 if set(orb_list).issubset(set(site_orbs)):
                     site_orbs = list(set(site_orbs) - set(orb_list)) + [orb]
-            new = pd.DataFrame({"species": species,
-                                "site": idx,
-                                "orb": [site_orbs]}, index=[1])
-            res_df = res_df.append(new, ignore_index=True)
+            res_rows.append({"species": species, "site": idx, "orb": site_orbs})
 
+    res_df = pd.DataFrame(res_rows, columns=["species", "site", "orb"])
     # display(res_df)
 
     # 合并具有同样元素同一轨道的格点
@@ -130,7 +177,7 @@ def dos_analysis_df(dos_df, pick_rate=0.1):
                 new = pd.DataFrame({"species": species,
                                     "site": -1,
                                     "orb": [list(ref_orb)]})
-                res_df = res_df.append(new, ignore_index=True)
+                res_df = pd.concat([res_df, new], ignore_index=True)
 
     # display(res_df)
     return n_orb, res_df, df
@@ -159,20 +206,38 @@ def w90_string(res_df, structure):
             w90_string_list.append(f"c={site_string}:{orb_string(row['orb'])}")
     print('\n'.join([s for s in w90_string_list]))
 
-def dos_given_site_orb(dos_data_total, erange, key_string, orb_names=['s', 'py', 'pz', 'px', 'dxy', 'dyz', 'dz2', 'dxz', 'dx2']):
-    structure = dos_data_total.structure
-    _, site_id, orb_id = key_string.split('_')
-    res = 0
-    site = structure[int(site_id)]
-    orb = Orbital(orb_names.index(orb_id))
-    dos = dos_data_total.get_site_orbital_dos(site, orb)
-    # TODO handle different magnetic system
-    dis = dos_distribute(dos.energies, dos.densities[Spin.up], erange)
-    return dis
-
-def dos_given_selected(dos_data_total, erange, selected):
-    dis = [dos_given_site_orb(dos_data_total, erange, key) for key in selected]
-    return np.sum(dis)
+class DosWindowIndex():
+    '''
+    Cumulative integrals of the summed PDOS of `selected` orbitals and of the TDOS of
+    `spin` channel, built once per vasprun.xml to score any batch of energy windows in one call.
+    '''
+    def __init__(self, dos_data_total, selected, spin=0):
+        self.energies = dos_data_total.energies
+        self.spin = spin
+        pdos = np.zeros_like(self.energies)
+        for key in selected:
+            _, site_id, orb_id = key.split('_')
+            pdos = pdos + dos_data_total.site_orbital_dos(int(site_id), orb_id, spin=spin)
+        self.dos = np.array([pdos, dos_data_total.tdos[spin]])
+        self.cum = cumulative_dos(self.energies, self.dos)
+
+    @profiled
+    def score(self, fmin, fmax):
+        '''
+        PDOS, TDOS and PDOS / TDOS inside windows [fmin, fmax] (scalars or arrays).
+        '''
+        pdos, tdos = window_dos(self.energies, self.dos, self.cum, (np.asarray(fmin, dtype=float),
+                                                                    np.asarray(fmax, dtype=float)))
+        return pdos, tdos, pdos / tdos
+
+def dos_given_site_orb(dos_data_total, erange, key_string):
+    return dos_given_selected(dos_data_total, erange, [key_string])
+
+def dos_given_selected(dos_data_total, erange, selected, index=None):
+    if index is None:
+        index = dos_data_total.dos_index(selected) if isinstance(dos_data_total, Calculation) \
+                else DosWindowIndex(dos_data_total, selected)
+    return index.score(*erange)[0]
 
 def select_str2list(s, orb_names=['s', 'py', 'pz', 'px', 'dxy', 'dyz', 'dz2', 'dxz', 'dx2']):
     def num2list(s):
@@ -205,7 +270,22 @@ def kpath(kpoints, delimeter=None):
         s2 = nice_string(nums[i+1], labels[i+1])
         print(f'{s1}  {s2}')
 
+def kpath_distance(kpoints, reciprocal_lattice, nseg):
+    '''
+    Accumulated distance along a line-mode k-path, which doesn't increase
+    between the end of one segment and the start of the next one.
+    '''
+    dk = np.linalg.norm(np.diff(kpoints @ reciprocal_lattice, axis=0), axis=1)
+    dk[nseg-1::nseg] = 0
+    return np.concatenate([[0], np.cumsum(dk)])
+
+@profiled
 def export_vasp_band(path):
+    '''
+    Band data of `{path}/vasprun.xml` in p4vasp format. `path` can also be a `Calculation`.
+    '''
+    calc = path if isinstance(path, Calculation) else Calculation(path)
+    path = calc.path
     def export2dat(kk, EE, filename):
         lines = []
         nbnds, nk = EE.shape
@@ -217,18 +297,20 @@ def export_vasp_band(path):
             f.writelines(lines)
 
     print(f"Generate p4vasp format bnd.dat file from {path}/vasprun.xml")
-    run = Vasprun(f'{path}/vasprun.xml')
-    bands = run.get_band_structure(f'{path}/KPOINTS', line_mode=True)
-    nspin = len(bands.bands.keys())
-    kk = bands.distance
+    run = calc.vasprun('structure', 'eigenvalues')
+    # number of k-points in each line segment of line-mode `KPOINTS`
+    with open(f'{path}/KPOINTS', 'r') as f:
+        nseg = int(f.readlines()[1].split()[0])
+    kk = kpath_distance(run.kpoints, run.structure.reciprocal_lattice, nseg)
+    nspin = len(run.ebands)
     if nspin == 1:
         print('export band data to `bnd.dat`.')
-        export2dat(kk, bands.bands[Spin.up], f'{path}/bnd.dat')
+        export2dat(kk, run.ebands[0].T, f'{path}/bnd.dat')
     elif nspin == 2:
         print('NSPIN = 2')
         print('export band data to `bnd_up.dat` and `bnd_down.dat` separatly.')
-        export2dat(kk, bands.bands[Spin.up], f'{path}/bnd_up.dat')
-        export2dat(kk, bands.bands[Spin.down], f'{path}/bnd_down.dat')
+        export2dat(kk, run.ebands[0].T, f'{path}/bnd_up.dat')
+        export2dat(kk, run.ebands[1].T, f'{path}/bnd_down.dat')
 
 def template(flag):
     if flag == 'wann':
@@ -268,13 +350,79 @@ def template(flag):
     else:
         print('Unknown flag: ', flag)
 
-def get_args():
+def run_dos(args, calc, w90=None):
+    '''
+    `dos` mode on the `Calculation` `calc`. `w90server.py` also gives the `W90` of its EIGENVAL.
+    '''
+    left, right = args.erange #-4, 8
+    left, right = (right, left) if right < left else (left, right)
+    pick_rate = args.pick #0 .08
+
+    dos_data_total = calc.vasprun('structure', 'pdos')
+    structure = dos_data_total.structure
+    dos_df = gen_dos_df(calc, left, right)
+    print(f"\nCalculated DOS Energy Range: {left}, {right}")
+
+    if len(args.extra) == 0:
+        print(dos_df)
+        norb, simple_res_df, full_res_df = dos_analysis_df(dos_df, pick_rate=pick_rate)
+        nwann = norb if args.no_soc else 2 * norb
+        print(f"\nNumber of Selected Orbitals: {norb}")
+        print(f"\nNumber of Selected WFs: {nwann}")
+        print("\nSelected Orbitals: ")
+        print(simple_res_df)
+        print("\nWannier90 Projection:")
+        w90_string(simple_res_df, structure)
+
+        if args.plot:
+            selected = select_str2list(args.extra)
+            plot_dos_dis(dos_df, selected=selected, filename=f'{args.path}/dos_analysis.png')
+
+    else:
+        selected = select_str2list(args.extra)
+        nwann = len(selected) if args.no_soc else 2 * len(selected)
+
+        if w90 is None:
+            from dis_win_suggest import W90
+            w90 = W90(calc=calc)
+        # the `W90` of `w90server.py` is shared by the later requests, so its settings are restored
+        saved = w90.efermi, w90.nbnds_excl, w90.nwann, w90.ndeg
+        w90.efermi, w90.nbnds_excl, w90.nwann, w90.ndeg = dos_data_total.efermi, 0, nwann, 1
+        try:
+            dis_froz_df = w90.get_dis_froz_df(args.erange, eps=4e-3)
+            dis_win_max = w90.suggest_win_max(args.erange[0])
+        finally:
+            w90.efermi, w90.nbnds_excl, w90.nwann, w90.ndeg = saved
+
+        # score all the suggested frozen windows at once
+        index = calc.dos_index(selected, spin=w90.spin)
+        dis_pdos, dis_tdos, percent = index.score(dis_froz_df['dis_froz_min'], dis_froz_df['dis_froz_max'])
+
+        dis_froz_dos_df = dis_froz_df.assign(pdos=dis_pdos, tdos=dis_tdos, percent=percent)
+        dis_froz_dos_df = dis_froz_dos_df.sort_values('percent', ascending=False)
+        N = len(dis_froz_dos_df)
+        print(dis_froz_dos_df)
+
+        print(f'\nLowest `dis_win_max` for {args.erange[0]}: {dis_win_max}')
+
+        if args.plot:
+            plot_dos_dis(dos_df, selected=selected, filename=f'{args.path}/dos_analysis_selected.png')
+
+def run_score(args, index):
+    '''
+    `score` mode: PDOS of the `--extra` orbitals, TDOS and their ratio inside the window `-e`.
+    '''
+    fmin, fmax = sorted(args.erange)
+    pdos, tdos, percent = index.score(fmin, fmax)
+    print(f'Window [{fmin}, {fmax}]    PDOS: {pdos:.6f}    TDOS: {tdos:.6f}    PDOS / TDOS: {percent:.6f}')
+
+def get_args(argv=None):
     '''
     CML parser.
     '''
-    parser = argparse.ArgumentParser(description="Pre analysis before Wannier90 Interpolation.\n    dos: python pre_w90_tool.py dos --plot -e -4 7 --extra 'Bi,4-7,0-3;F,8-23,1-3'",     add_help=True)
+    parser = argparse.ArgumentParser(prog='pre_w90_tool.py', description="Pre analysis before Wannier90 Interpolation.\n    dos: python pre_w90_tool.py dos --plot -e -4 7 --extra 'Bi,4-7,0-3;F,8-23,1-3'",     add_help=True)
 
-    parser.add_argument('mode', help='Mode: kpath, band, template, dos (Actually only the first character is relevant.)')
+    parser.add_argument('mode', help='Mode: kpath, band, template, dos, score, wdos (Actually only the first character is relevant.)')
     parser.add_argument('--path', default='.',
                         help='Default: .')
     parser.add_argument('--no-soc', action='store_true', default=False,
@@ -288,10 +436,28 @@ def get_args():
                         help='plot the dos distribution')
     parser.add_argument('--extra', action='store', type=str, default='',
                         help='Extra input. In `template` mode, you can use `wann`, `basic` and `band`.')
-    return parser.parse_args()
+    parser.add_argument('--no-cache', default=False, action="store_true",
+                        help='Neither read nor write the binary cache of parsed `EIGENVAL` in `dos --extra` mode or `wannier90_hr.dat` in `wdos` mode.')
+    parser.add_argument('--hr', default='wannier90_hr.dat',
+                        help='Wannier90 Hamiltonian for `wdos` mode. Default: wannier90_hr.dat')
+    parser.add_argument('--mesh', default=[50, 50, 50], type=int, nargs=3,
+                        help='k-point mesh for `wdos` mode. Default: 50 50 50')
+    parser.add_argument('--sigma', default=0.05, type=float,
+                        help='Gaussian broadening (eV) for `wdos` mode, 0 for histogram. Default: 0.05')
+    parser.add_argument('--nedos', default=2001, type=int,
+                        help='Number of energy points for `wdos` mode. Default: 2001')
+    parser.add_argument('--workers', default=None, type=int,
+                        help='Number of processes for `wdos` mode. Default: number of CPUs')
+    parser.add_argument('--profile', default=None, nargs='?', const='', metavar='FILE',
+                        help='Print wall time and calls of each stage at exit. With FILE, also dump a JSON trace (*.json) or cProfile statistics (other names).')
+    parser.add_argument('--profile-mem', default=False, action="store_true",
+                        help='Also trace the peak memory of each stage with tracemalloc, with or without --profile. It slows down allocations, so the times are larger than without it.')
+    return parser.parse_args(argv)
 
 if __name__ == "__main__":
     args = get_args()
+    if args.profile is not None or args.profile_mem:
+        PROFILER.start(args.profile, memory=args.profile_mem)
 
     if args.mode[0].lower() == 'k': # generate kpath
         if 'KPOINTS' in os.listdir(args.path):
@@ -307,64 +473,30 @@ if __name__ == "__main__":
         else:
             template(args.extra)
     elif args.mode[0].lower() == 'b':   # generate p4vasp-like band data file
-        export_vasp_band(args.path)
+        export_vasp_band(Calculation(args.path, vasprun=('structure', 'eigenvalues')))
     elif args.mode[0].lower() == 'd':   # DOS Analysis
-        left, right = args.erange #-4, 8
-        left, right = (right, left) if right < left else (left, right)
-        pick_rate = args.pick #0 .08
-
-        vasprun = Vasprun(f"{args.path}/vasprun.xml")
         print(f"Reading vasprun.xml file from `{args.path}/vasprun.xml` for dos analysis")
-        dos_data_total = vasprun.complete_dos       # get dos data
-        structure = dos_data_total.structure
-        dos_df = gen_dos_df(dos_data_total, left, right)
-        print(f"\nCalculated DOS Energy Range: {left}, {right}")
-
-        if len(args.extra) == 0:
-            print(dos_df)
-            norb, simple_res_df, full_res_df = dos_analysis_df(dos_df, pick_rate=pick_rate)
-            nwann = norb if args.no_soc else 2 * norb
-            print(f"\nNumber of Selected Orbitals: {norb}")
-            print(f"\nNumber of Selected WFs: {nwann}")
-            print("\nSelected Orbitals: ")
-            print(simple_res_df)
-            print("\nWannier90 Projection:")
-            w90_string(simple_res_df, structure)
-
-            if args.plot:
-                selected = select_str2list(args.extra)
-                plot_dos_dis(dos_df, selected=selected, filename=f'{args.path}/dos_analysis.png')
-
-        else:
-            selected = select_str2list(args.extra)
-            nwann = len(selected) if args.no_soc else 2 * len(selected)
-
-            from dis_win_suggest import W90, get_efermi
-
-            w90 = W90(eig=f'{args.path}/EIGENVAL',
-                      path=args.path,
-                      efermi=get_efermi(args, direct=True), 
-                      nbnds_excl=0, 
-                      nwann=nwann, 
-                      ndeg=1)
-
-            dis_froz_df = w90.get_dis_froz_df(args.erange, eps=4e-3)
-            dis_tdos_l, dis_pdos_l, percent_l = [], [], []
-            for fmin, fmax in zip(dis_froz_df['dis_froz_min'], dis_froz_df['dis_froz_max']):
-                dis_pdos = dos_given_selected(dos_data_total, (fmin, fmax), selected)
-                dis_tdos = dos_distribute(vasprun.tdos.energies, vasprun.tdos.densities[Spin.up], (fmin, fmax))
-                percent  = dis_pdos / dis_tdos
-                dis_tdos_l.append(dis_tdos)
-                dis_pdos_l.append(dis_pdos)
-                percent_l.append(percent)
-
-            dis_froz_dos_df = dis_froz_df.assign(pdos=dis_pdos_l, tdos=dis_tdos_l, percent=percent_l)
-            dis_froz_dos_df = dis_froz_dos_df.sort_values('percent', ascending=False)
-            N = len(dis_froz_dos_df)
-            print(dis_froz_dos_df)
-
-            dis_win_max = w90.suggest_win_max(args.erange[0])
-            print(f'\nLowest `dis_win_max` for {args.erange[0]}: {dis_win_max}')
-
-            if args.plot:
-                plot_dos_dis(dos_df, selected=selected, filename=f'{args.path}/dos_analysis_selected.png')
+        run_dos(args, Calculation(args.path, cache=not args.no_cache, vasprun=('structure', 'tdos', 'pdos')))
+    elif args.mode[0].lower() == 's':   # score of an energy window
+        calc = Calculation(args.path, vasprun=('tdos', 'pdos'))
+        run_score(args, calc.dos_index(select_str2list(args.extra)))
+    elif args.mode[0].lower() == 'w':   # DOS from Wannier90 Hamiltonian
+        from wannier_hr import WannierHR, wannier_dos
+
+        left, right = sorted(args.erange)
+        energies = np.linspace(left, right, args.nedos)
+        hr = WannierHR(args.hr, path=args.path, cache=not args.no_cache)
+        print(f"Wannier DOS from `{args.path}/{args.hr}` with {hr.num_wann} WFs on {'x'.join(map(str, args.mesh))} k-mesh")
+        dos = wannier_dos(hr, args.mesh, energies, sigma=args.sigma, workers=args.workers)
+        # spin degeneracy as in the VASP TDOS of a calculation without SOC
+        dos = dos if not args.no_soc else 2 * dos
+        print(f"States in [{left}, {right}]: {window_dos(energies, dos, cumulative_dos(energies, dos), [left, right]):.6f}")
+        np.savetxt(f'{args.path}/wannier_dos.dat', np.column_stack([energies, dos]), fmt='%14.6f', header='energy dos')
+        print(f"Output DOS: {args.path}/wannier_dos.dat")
+
+        if args.plot:
+            vasp, efermi = None, 0
+            if os.path.isfile(f'{args.path}/vasprun.xml'):
+                run = Calculation(args.path, vasprun=('tdos',)).vasprun()
+                vasp, efermi = (run.energies, run.tdos.sum(axis=0)), run.efermi
+            plot_wannier_dos(energies, dos, efermi=efermi, vasp=vasp, filename=f'{args.path}/wannier_dos.png')
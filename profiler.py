@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+import os
+import time
+import threading
+import json
+import atexit
+import functools
+import tracemalloc
+
+class Profiler():
+    '''
+    Wall time, peak memory and call count of named stages. Stages are only recorded
+    after `start`, so the instrumentation costs one attribute check otherwise.
+    Calls from worker threads / processes are not recorded, only their stage as a whole.
+
+    With `memory`, the peak of Python / numpy allocations traced by `tracemalloc` during
+    the stage above the memory at its start, nested stages included, is also recorded.
+    The tracing slows down allocations a lot, so the times are then larger than without it.
+    '''
+    def __init__(self):
+        self.enabled = False
+        self.stats = {}
+        self.trace = []
+        self._stack = []
+        self._output = None
+        self._cprofile = None
+        self._t0 = 0.
+        self._owner = None
+        self.memory = False
+
+    def start(self, output=None, memory=False):
+        '''
+        Start recording. The summary is printed at exit, and dumped to `output` as a
+        JSON trace (`*.json`) or as cProfile statistics (any other name) if given.
+        The peak memory of each stage is only traced with `memory`.
+        '''
+        self.enabled = True
+        self.memory = memory
+        self._owner = (os.getpid(), threading.get_ident())
+        self._output = output
+        self._t0 = time.perf_counter()
+        if memory:
+            tracemalloc.start()
+        if output and not output.endswith('.json'):
+            import cProfile
+            self._cprofile = cProfile.Profile()
+            self._cprofile.enable()
+        atexit.register(self.stop)
+
+    def stop(self):
+        if not self.active():
+            return
+        self.enabled = False
+        if self._cprofile:
+            self._cprofile.disable()
+            self._cprofile.dump_stats(self._output)
+        if self.memory:
+            tracemalloc.stop()
+        self.summary()
+        if self._output and self._output.endswith('.json'):
+            with open(self._output, 'w') as f:
+                json.dump({'stats': self.stats, 'trace': self.trace}, f, indent=1)
+        if self._output:
+            print(f'Profile written to {self._output}')
+
+    def active(self):
+        return self.enabled and (os.getpid(), threading.get_ident()) == self._owner
+
+    def enter(self, name):
+        cur, peak = tracemalloc.get_traced_memory() if self.memory else (0, 0)
+        if self._stack:
+            self._stack[-1]['peak'] = max(self._stack[-1]['peak'], peak)
+        if self.memory:
+            tracemalloc.reset_peak()
+        self._stack.append({'name': name, 'start': time.perf_counter(), 'base': cur, 'peak': cur})
+
+    def exit(self):
+        end = time.perf_counter()
+        _, peak = tracemalloc.get_traced_memory() if self.memory else (0, 0)
+        entry = self._stack.pop()
+        entry['peak'] = max(entry['peak'], peak)
+        if self._stack:
+            self._stack[-1]['peak'] = max(self._stack[-1]['peak'], entry['peak'])
+
+        wall, mem = end - entry['start'], entry['peak'] - entry['base']
+        stat = self.stats.setdefault(entry['name'], {'calls': 0, 'time': 0.})
+        stat['calls'] += 1
+        stat['time'] += wall
+        call = {'name': entry['name'], 'start': entry['start'] - self._t0, 'time': wall, 'depth': len(self._stack)}
+        if self.memory:
+            stat['peak_mb'] = max(stat.get('peak_mb', 0.), mem / 2**20)
+            call['peak_mb'] = mem / 2**20
+        self.trace.append(call)
+
+    def stage(self, name):
+        '''
+        Context manager recording the block as stage `name`.
+        '''
+        return _Stage(self, name)
+
+    def summary(self):
+        total = time.perf_counter() - self._t0
+        print(f'\n{"stage":<32s} {"calls":>7s} {"time / s":>10s} {"time %":>7s}' + (f' {"peak / MB":>10s}' if self.memory else ''))
+        for name, stat in sorted(self.stats.items(), key=lambda x: -x[1]['time']):
+            print(f'{name:<32s} {stat["calls"]:7d} {stat["time"]:10.4f} {stat["time"] / total * 100:7.1f}'
+                  + (f' {stat["peak_mb"]:10.2f}' if self.memory else ''))
+        print(f'{"total":<32s} {"":>7s} {total:10.4f}')
+        if self.memory:
+            print('Times include the overhead of tracemalloc (--profile-mem).')
+
+class _Stage():
+    def __init__(self, profiler, name):
+        self.profiler, self.name = profiler, name
+
+    def __enter__(self):
+        self.active = self.profiler.active()
+        if self.active:
+            self.profiler.enter(self.name)
+
+    def __exit__(self, *exc):
+        if self.active:
+            self.profiler.exit()
+        return False
+
+# shared by all the modules of the toolbox
+PROFILER = Profiler()
+
+def profiled(func=None, name=None):
+    '''
+    Decorator recording every call of `func` as a stage of `PROFILER`,
+    named after the function unless `name` is given.
+    '''
+    if func is None:
+        return functools.partial(profiled, name=name)
+    name = name if name else func.__qualname__
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if not PROFILER.enabled:
+            return func(*args, **kwargs)
+        with PROFILER.stage(name):
+            return func(*args, **kwargs)
+    return wrapper
@@ -0,0 +1,202 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+import re
+from collections import namedtuple
+import xml.etree.ElementTree as ET
+import numpy as np
+
+from profiler import profiled
+
+# Orbital order of the partial DOS fields in vasprun.xml (LORBIT = 11), same as `pymatgen.Orbital`.
+# `x2-y2` is renamed to `dx2` to follow the orbital names used in this toolbox.
+ORB_NAMES = ['s', 'py', 'pz', 'px', 'dxy', 'dyz', 'dz2', 'dxz', 'dx2']
+FIELD_RENAME = {'x2-y2': 'dx2'}
+
+EFERMI_RE = re.compile(rb'<i name="efermi">\s*([-+]?\d+(?:\.\d*)?(?:[eE][-+]?\d+)?)\s*</i>')
+
+Site = namedtuple('Site', ['species_string', 'frac_coords'])
+
+class Structure(list):
+    '''
+    Light-weight structure, a list of `Site` with `lattice` vectors as rows (Angstrom).
+    '''
+    def __init__(self, lattice, species, frac_coords):
+        super().__init__(Site(s, c) for s, c in zip(species, frac_coords))
+        self.lattice = lattice
+
+    @property
+    def num_sites(self):
+        return len(self)
+
+    @property
+    def reciprocal_lattice(self):
+        # with the factor 2 pi, same as `pymatgen`
+        return 2 * np.pi * np.linalg.inv(self.lattice).T
+
+class VasprunData():
+    '''
+    Pieces extracted from vasprun.xml by `read_vasprun`. Pieces not requested are None.
+
+    energies:  (nedos,)                           DOS energy grid
+    tdos:      (nspin, nedos)                     total DOS
+    pdos:      (len(pdos_sites), norb, nspin, nedos) partial DOS of `pdos_sites` and `orb_names`
+    kpoints:   (nkpts, 3)                         fractional coordinates
+    ebands:    (nspin, nkpts, nbnds)              eigenvalues of the last calculation
+    '''
+    def __init__(self):
+        self.efermi = None
+        self.structure = None
+        self.energies = None
+        self.tdos = None
+        self.pdos = None
+        self.pdos_sites = None
+        self.orb_names = None
+        self.kpoints = None
+        self.ebands = None
+
+    def site_orbital_dos(self, site, orb, spin=0):
+        '''
+        Partial DOS of structure index `site` and orbital name `orb`.
+        '''
+        i = self.pdos_sites.index(site)
+        j = self.orb_names.index(orb)
+        return self.pdos[i, j, spin]
+
+def rows2array(rows):
+    return np.fromstring(' '.join(rows), sep=' ').reshape(len(rows), -1)
+
+@profiled
+def read_efermi(fname, chunk_size=1 << 22):
+    '''
+    Fermi level of the last `<i name="efermi">` in vasprun.xml. The DOS section
+    holding it is at the end of the file, so the file is scanned backwards in
+    chunks and the eigenvalues / projections are never read.
+    '''
+    with open(fname, 'rb') as f:
+        end = f.seek(0, 2)
+        tail = b''
+        while end > 0:
+            start = max(0, end - chunk_size)
+            f.seek(start)
+            buf = f.read(end - start) + tail
+            m = None
+            for m in EFERMI_RE.finditer(buf):
+                pass
+            if m:
+                return float(m.group(1))
+            tail, end = buf[:128], start
+    raise ValueError(f'There is no Fermi level in {fname}.')
+
+@profiled
+def read_vasprun(fname, structure=True, tdos=True, pdos=False, sites=None, orbitals=None, eigenvalues=False, kpoints=False):
+    '''
+    Incremental reader of vasprun.xml, which only keeps the requested pieces.
+
+    Elements are cleared as soon as they are closed, so the memory is bounded by
+    the requested arrays and the largest single `<set>`, not by the file size.
+
+    structure:   final structure with species and lattice
+    tdos:        total DOS and its energy grid
+    pdos:        partial DOS, restricted to structure indices `sites` and orbital names `orbitals` if given
+    eigenvalues: k-points and band energies
+    kpoints:     k-points only
+    The Fermi level is always read.
+    '''
+    data = VasprunData()
+    sites = None if sites is None else set(sites)
+
+    # stack of (tag, name, comment) of the open elements
+    stack = []
+    rows, species, fields = [], [], []
+    crystal = {}
+    structures = {}
+    tdos_sets, pdos_sets, ebands_sets, kpts = [], {}, [], []
+    ion = -1
+
+    context = ET.iterparse(fname, events=('start', 'end'))
+    _, root = next(context)
+    stack.append((root.tag, None, None))
+    for event, elem in context:
+        tag = elem.tag
+        if event == 'start':
+            stack.append((tag, elem.get('name'), elem.get('comment')))
+            if tag == 'set' and stack[-2][0] == 'set' and len(stack) > 3 and stack[-4][0] == 'partial':
+                ion = int(elem.get('comment').split()[-1]) - 1
+            continue
+
+        parent = stack[-2] if len(stack) > 1 else (None, None, None)
+        sect = [s[0] for s in stack]
+
+        if tag == 'r':
+            if 'dos' in sect:
+                if 'total' in sect and (tdos or pdos):
+                    rows.append(elem.text)
+                elif 'partial' in sect and pdos and (sites is None or ion in sites) \
+                        and int(parent[2].split()[-1]) <= len(tdos_sets):
+                    rows.append(elem.text)
+            elif eigenvalues and parent[0] == 'set' and sect[-7:-3] == ['calculation', 'eigenvalues', 'array', 'set']:
+                rows.append(elem.text.split(None, 1)[0])
+
+        elif tag == 'v':
+            if parent[1] == 'kpointlist' and (eigenvalues or kpoints):
+                kpts.append(elem.text)
+            elif parent[1] in ('basis', 'positions') and 'structure' in sect and structure:
+                crystal.setdefault(parent[1], []).append(elem.text)
+
+        elif tag == 'i' and elem.get('name') == 'efermi' and parent[0] == 'dos':
+            data.efermi = float(elem.text)
+
+        elif tag == 'rc' and 'atominfo' in sect and stack[-3][1] == 'atoms':
+            species.append(elem[0].text.strip())
+
+        elif tag == 'field' and parent[0] == 'array' and 'partial' in sect:
+            field = elem.text.strip()
+            fields.append(FIELD_RENAME.get(field, field))
+
+        elif tag == 'set' and rows:
+            if 'total' in sect:
+                tdos_sets.append(rows2array(rows))
+            elif 'partial' in sect:
+                pdos_sets.setdefault(ion, []).append(rows2array(rows))
+            else:
+                ebands_sets.append(np.array(rows, dtype=float))
+            rows = []
+
+        elif tag == 'eigenvalues' and parent[0] == 'calculation' and ebands_sets:
+            # only keep the last calculation
+            data.ebands, ebands_sets = ebands_sets, []
+
+        elif tag == 'structure' and crystal:
+            lattice = rows2array(crystal['basis'])
+            positions = rows2array(crystal['positions'])
+            structures[elem.get('name')] = (lattice, positions)
+            crystal = {}
+
+        elif tag == 'dos' and tdos_sets:
+            data.energies = tdos_sets[0][:, 0]
+            data.tdos = np.array([s[:, 1] for s in tdos_sets])
+            if pdos_sets:
+                fields = fields[1:]      # the first field is energy
+                cols = [fields.index(o) + 1 for o in orbitals] if orbitals else list(range(1, len(fields) + 1))
+                data.orb_names = [fields[c - 1] for c in cols]
+                data.pdos_sites = sorted(pdos_sets)
+                data.pdos = np.array([[s[:, cols].T for s in pdos_sets[i]] for i in data.pdos_sites])
+                data.pdos = np.ascontiguousarray(data.pdos.transpose(0, 2, 1, 3))
+            tdos_sets, pdos_sets, fields = [], {}, []
+
+        stack.pop()
+        # `<c>` is read from its parent `<rc>`
+        if tag != 'c':
+            elem.clear()
+        if len(stack) == 1:
+            root.clear()
+
+    if structure and structures:
+        lattice, positions = structures.get('finalpos', list(structures.values())[-1])
+        data.structure = Structure(lattice, species, positions)
+    if kpts:
+        data.kpoints = rows2array(kpts)
+    if eigenvalues and data.ebands is not None:
+        nspin = len(data.ebands) // len(kpts)
+        data.ebands = np.array(data.ebands).reshape(nspin, len(kpts), -1)
+    return data
@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+import os
+import json
+import numpy as np
+
+# Binary cache of parsed text files, stored as `.{name}.w90cache` next to the input file:
+#   8-byte magic | 8-byte header length | JSON header | float64 arrays aligned to 64 bytes
+CACHE_MAGIC = b'W90CAC01'
+
+def cache_name(fname):
+    dname, bname = os.path.split(os.path.abspath(fname))
+    return os.path.join(dname, f'.{bname}.w90cache')
+
+def fingerprint(fname):
+    st = os.stat(fname)
+    return {'path': os.path.abspath(fname), 'size': st.st_size, 'mtime': st.st_mtime_ns}
+
+def save_cache(fname, data, arrays):
+    '''
+    Write the arrays named in `arrays` and the other (JSON serializable) items of
+    `data` to the cache file of `fname`. Arrays which are None are kept as None.
+    Failing to write (e.g. read-only directory) is not an error.
+    '''
+    blocks = {k: np.ascontiguousarray(data[k], dtype='<f8') for k in arrays if data[k] is not None}
+    offsets, offset = {}, 0
+    for k, arr in blocks.items():
+        offsets[k] = offset
+        offset += -(-arr.nbytes // 64) * 64
+    header = {'fingerprint': fingerprint(fname),
+              'items': {k: v for k, v in data.items() if k not in arrays},
+              'arrays': {k: [list(arr.shape), offsets[k]] for k, arr in blocks.items()},
+              'none': [k for k in arrays if data[k] is None]}
+    header = json.dumps(header).encode()
+
+    cache = cache_name(fname)
+    tmp = f'{cache}.{os.getpid()}.tmp'
+    try:
+        with open(tmp, 'wb') as f:
+            f.write(CACHE_MAGIC + len(header).to_bytes(8, 'little') + header)
+            start = -(-f.tell() // 64) * 64
+            for k, arr in blocks.items():
+                f.seek(start + offsets[k])
+                f.write(arr.tobytes())
+        os.replace(tmp, cache)
+    except OSError:
+        if os.path.isfile(tmp):
+            os.remove(tmp)
+
+def load_cache(fname):
+    '''
+    Memory map the cached arrays of `fname` (read-only) together with the other items.
+    Return None if there is no cache or the cache doesn't match the current path,
+    size and mtime of `fname`.
+    '''
+    cache = cache_name(fname)
+    if not os.path.isfile(cache):
+        return None
+    with open(cache, 'rb') as f:
+        if f.read(8) != CACHE_MAGIC:
+            return None
+        size = int.from_bytes(f.read(8), 'little')
+        header = json.loads(f.read(size))
+        start = -(-f.tell() // 64) * 64
+    if header['fingerprint'] != fingerprint(fname):
+        return None
+
+    data = dict(header['items'])
+    data.update({k: None for k in header['none']})
+    for k, (shape, offset) in header['arrays'].items():
+        data[k] = np.memmap(cache, dtype='<f8', mode='r', offset=start+offset, shape=tuple(shape))
+    return data
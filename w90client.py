@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+import os
+import sys
+import json
+import socket
+import tempfile
+import argparse
+
+# default socket of `w90server.py`, one per user
+SOCKET = os.path.join(tempfile.gettempdir(), f'w90server-{os.getuid()}.sock')
+# CLIs answered by the server, with the arguments of the scripts themselves
+TOOLS = ['dis_win_suggest', 'pre_w90_tool']
+
+def request(req, sock=SOCKET):
+    '''
+    Send one request (dict) to the server listening on `sock` and return its response (dict).
+    '''
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+        s.connect(sock)
+        s.sendall(json.dumps(req).encode() + b'\n')
+        with s.makefile('rb') as f:
+            return json.loads(f.readline())
+
+def get_args():
+    '''
+    CML parser.
+    '''
+    parser = argparse.ArgumentParser(description='Thin client of `w90server.py`. Only the standard library is imported, so a query costs the interpreter startup and the answer of the server.',
+                                     usage='%(prog)s [-h] [--socket SOCKET] [--time] {dis_win_suggest,pre_w90_tool,stats,shutdown} ...',
+                                     add_help=True)
+    parser.add_argument('--socket', default=SOCKET,
+                        help=f'Unix socket of the server. Default: {SOCKET}')
+    parser.add_argument('--time', default=False, action="store_true",
+                        help='Print the time the server took to answer.')
+    parser.add_argument('tool', help='dis_win_suggest or pre_w90_tool (`.py` is optional) followed by the arguments of the script, or `stats`, `shutdown` of the server.')
+    parser.add_argument('argv', nargs=argparse.REMAINDER, help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = get_args()
+
+    tool = args.tool[:-3] if args.tool.endswith('.py') else args.tool
+    if tool in TOOLS:
+        req = {'cmd': 'run', 'tool': tool, 'argv': args.argv, 'cwd': os.getcwd()}
+    elif tool in ['stats', 'shutdown']:
+        req = {'cmd': tool}
+    else:
+        print(f'Unsupported tool: {args.tool}', file=sys.stderr)
+        sys.exit(2)
+
+    try:
+        res = request(req, sock=args.socket)
+    except (FileNotFoundError, ConnectionRefusedError):
+        print(f'There is no server on {args.socket}. Please start one with `python w90server.py`.', file=sys.stderr)
+        sys.exit(1)
+
+    print(res['output'], end='', file=sys.stdout if res['ok'] else sys.stderr)
+    if args.time:
+        print(f'Answered in {res["time"] * 1000:.2f} ms', file=sys.stderr)
+    sys.exit(0 if res['ok'] else 1)
@@ -0,0 +1,182 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+import io
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+from contextlib import redirect_stdout, redirect_stderr
+
+import dis_win_suggest
+import pre_w90_tool
+from calculation import Calculation
+from w90cache import fingerprint
+from w90client import SOCKET, TOOLS
+
+class AnalysisServer():
+    '''
+    `Calculation` of each directory and band file kept in memory, so that the modes of
+    `dis_win_suggest.py` and the `dos` / `score` modes of `pre_w90_tool.py` are answered
+    without parsing the files again. A `Calculation` is created again when the size or
+    mtime of its band file, vasprun.xml or PROCAR changes.
+
+    Request:  {"cmd": "run", "tool": "dis_win_suggest", "argv": ["count", "-e", "-1", "1"], "cwd": "..."}
+              {"cmd": "stats"} or {"cmd": "shutdown"}
+    Response: {"ok": true, "output": "text printed by the CLI", "time": seconds}
+    '''
+    def __init__(self):
+        self.data = {}
+        self.nrequests = 0
+        self.stopped = False
+
+    def session(self, path, eig='EIGENVAL', cache=True):
+        '''
+        [`Calculation`, `W90` or None] of `eig` in `path`, created again when `eig`,
+        vasprun.xml or PROCAR has changed since.
+        '''
+        path = os.path.abspath(path)
+        fp = [fingerprint(f) if os.path.isfile(f) else None for f in [f'{path}/{eig}', f'{path}/vasprun.xml', f'{path}/PROCAR']]
+        if (path, eig) not in self.data or self.data[(path, eig)][0] != fp:
+            calc = Calculation(path, eig, cache=cache, vasprun=('structure', 'tdos', 'pdos'))
+            self.data[(path, eig)] = (fp, [calc, None])
+        return self.data[(path, eig)][1]
+
+    def w90(self, path, eig='EIGENVAL', cache=True):
+        session = self.session(path, eig, cache=cache)
+        if session[1] is None:
+            session[1] = dis_win_suggest.W90(calc=session[0])
+        return session[1]
+
+    def run(self, tool, argv):
+        '''
+        Run the CLI `tool` with arguments `argv` on the cached data.
+        '''
+        if tool == 'dis_win_suggest':
+            args = dis_win_suggest.get_args(argv)
+            w90 = self.w90(args.path, args.eig, cache=not args.no_cache)
+            w90.efermi = dis_win_suggest.get_efermi(args, calc=w90.calc)
+            w90.nbnds_excl, w90.nwann, w90.ndeg = args.nbnds_excl, args.nwann, args.ndeg
+            dis_win_suggest.run(args, w90)
+        else:
+            args = pre_w90_tool.get_args(argv)
+            if args.mode[0].lower() == 'd':
+                w90 = self.w90(args.path, cache=not args.no_cache) if args.extra else None
+                print(f"Using vasprun.xml file from `{args.path}/vasprun.xml` for dos analysis")
+                pre_w90_tool.run_dos(args, self.session(args.path, cache=not args.no_cache)[0], w90=w90)
+            elif args.mode[0].lower() == 's':
+                calc = self.session(args.path, cache=not args.no_cache)[0]
+                pre_w90_tool.run_score(args, calc.dos_index(pre_w90_tool.select_str2list(args.extra)))
+            else:
+                raise ValueError(f'Mode {args.mode} of pre_w90_tool.py is not served. Please run it directly.')
+
+    def stats(self):
+        lines = [f'{self.nrequests} requests, {len(self.data)} calculations in memory:']
+        for (path, eig), (_, (calc, _)) in self.data.items():
+            lines.append(f'  {path}/{eig}: {", ".join(calc.loaded())}')
+        return '\n'.join(lines) + '\n'
+
+    def handle(self, req):
+        '''
+        Answer one request (dict). The output of the CLI is captured instead of printed.
+        '''
+        t0 = time.perf_counter()
+        self.nrequests += 1
+        buf, ok = io.StringIO(), True
+        cwd = os.getcwd()
+        try:
+            with redirect_stdout(buf), redirect_stderr(buf):
+                if req.get('cmd') == 'stats':
+                    print(self.stats(), end='')
+                elif req.get('cmd') == 'shutdown':
+                    self.stopped = True
+                    print('Server stopped.')
+                elif req.get('cmd') == 'run' and req.get('tool') in TOOLS:
+                    os.chdir(req.get('cwd', cwd))
+                    self.run(req['tool'], req.get('argv', []))
+                else:
+                    raise ValueError(f'Unsupported request: {req}')
+        except SystemExit as e:       # argparse: --help or wrong arguments
+            ok = not e.code
+        except Exception as e:
+            ok = False
+            buf.write(f'{type(e).__name__}: {e}\n')
+        finally:
+            os.chdir(cwd)
+        return {'ok': ok, 'output': buf.getvalue(), 'time': time.perf_counter() - t0}
+
+    def handle_line(self, line):
+        try:
+            req = json.loads(line)
+        except ValueError as e:
+            return {'ok': False, 'output': f'Invalid JSON request: {e}\n', 'time': 0.}
+        return self.handle(req)
+
+def serve_stdio(server):
+    '''
+    One JSON request per line of stdin, one JSON response per line of stdout.
+    '''
+    out = sys.stdout
+    for line in sys.stdin:
+        if line.strip():
+            out.write(json.dumps(server.handle_line(line)) + '\n')
+            out.flush()
+        if server.stopped:
+            break
+
+def serve_socket(server, sock=SOCKET):
+    '''
+    Answer the requests of `w90client.py` on the Unix socket `sock`, one connection at a time.
+    '''
+    if os.path.exists(sock):
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+            if s.connect_ex(sock) == 0:
+                raise RuntimeError(f'There is already a server on {sock}.')
+        os.remove(sock)
+
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+        s.bind(sock)
+        os.chmod(sock, 0o600)
+        s.listen()
+        print(f'Listening on {sock}')
+        try:
+            while not server.stopped:
+                conn, _ = s.accept()
+                with conn, conn.makefile('rwb') as f:
+                    for line in f:
+                        f.write(json.dumps(server.handle_line(line)).encode() + b'\n')
+                        f.flush()
+                        if server.stopped:
+                            break
+        finally:
+            os.remove(sock)
+
+def get_args():
+    '''
+    CML parser.
+    '''
+    parser = argparse.ArgumentParser(description='Server keeping parsed EIGENVAL and vasprun.xml in memory for `w90client.py`.', add_help=True)
+    parser.add_argument('--socket', default=SOCKET,
+                        help=f'Unix socket to listen on. Default: {SOCKET}')
+    parser.add_argument('--stdio', default=False, action="store_true",
+                        help='Read JSON requests from stdin and write JSON responses to stdout instead of the socket.')
+    parser.add_argument('--preload', default=[], nargs='+',
+                        help='Calculation directories whose EIGENVAL and vasprun.xml are loaded at start.')
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = get_args()
+
+    server = AnalysisServer()
+    for path in args.preload:
+        calc = server.session(path)[0]
+        if os.path.isfile(f'{path}/vasprun.xml'):
+            calc.vasprun()
+        if os.path.isfile(f'{path}/EIGENVAL'):
+            server.w90(path)
+
+    if args.stdio:
+        serve_stdio(server)
+    else:
+        serve_socket(server, args.socket)
@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+import os
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+from w90cache import load_cache, save_cache
+from profiler import profiled
+
+HR_ARRAYS = ['ndegen', 'rvec', 'hr_real', 'hr_imag']
+
+@profiled
+def parse_hr(fname):
+    '''
+    Bulk parser of Wannier90 `seedname_hr.dat`.
+
+    After the header line, `num_wann`, `nrpts` and the `nrpts` degeneracy weights
+    (15 per line), every line is `R1 R2 R3 m n Re(H) Im(H)` for H_mn(R).
+
+    Return: ndegen (nrpts,), rvec (nrpts, 3), hr (nrpts, num_wann, num_wann) complex
+    '''
+    with open(fname, 'rb') as f:
+        f.readline()
+        num_wann = int(f.readline())
+        nrpts = int(f.readline())
+        ndegen = []
+        while len(ndegen) < nrpts:
+            ndegen += f.readline().split()
+        data = np.fromstring(f.read().decode(), sep=' ')
+    if data.size != nrpts * num_wann**2 * 7:
+        raise ValueError(f'Cannot parse {fname}: {data.size} numbers for {nrpts} R vectors and {num_wann} WFs.')
+    data.shape = (nrpts, num_wann**2, 7)
+
+    rvec = data[:, 0, :3].astype(int)
+    m, n = data[0, :, 3].astype(int) - 1, data[0, :, 4].astype(int) - 1
+    hr = np.zeros((nrpts, num_wann, num_wann), dtype=complex)
+    hr[:, m, n] = data[:, :, 5] + 1j * data[:, :, 6]
+    return np.array(ndegen, dtype=int), rvec, hr
+
+class WannierHR():
+    def __init__(self, hr='wannier90_hr.dat', path='.', cache=True):
+        '''
+        Tight-binding Hamiltonian H(R) of Wannier functions from `{path}/{hr}`.
+        '''
+        fname = f'{path}/{hr}'
+        data = load_cache(fname) if cache else None
+        if data is None:
+            ndegen, rvec, hr = parse_hr(fname)
+            data = {'ndegen': ndegen, 'rvec': rvec, 'hr_real': hr.real, 'hr_imag': hr.imag}
+            if cache:
+                save_cache(fname, data, HR_ARRAYS)
+
+        self.ndegen = np.asarray(data['ndegen'], dtype=int)
+        self.rvec = np.asarray(data['rvec'], dtype=float)
+        self.nrpts, self.num_wann, _ = data['hr_real'].shape
+        # H(R) / ndegen(R) flattened for the Fourier sum
+        hr = np.asarray(data['hr_real']) + 1j * np.asarray(data['hr_imag'])
+        self.hr_weighted = (hr / self.ndegen[:, None, None]).reshape(self.nrpts, -1)
+
+    def hamiltonian(self, kpts):
+        '''
+        H(k) = sum_R exp(2 pi i k.R) H(R) / ndegen(R) of k-points (nk, 3) in fractional coordinates.
+
+        Return: (nk, num_wann, num_wann)
+        '''
+        phase = np.exp(2j * np.pi * (np.asarray(kpts) @ self.rvec.T))
+        return (phase @ self.hr_weighted).reshape(-1, self.num_wann, self.num_wann)
+
+    def chunk_size(self, max_mem=256):
+        '''
+        Number of k-points in each batch so that the phases and H(k) take about `max_mem` MB.
+        '''
+        nbytes = 16 * (self.nrpts + 2 * self.num_wann**2)
+        return max(1, int(max_mem * 2**20 // nbytes))
+
+    @profiled
+    def eigenvalues(self, kpts, max_mem=256):
+        '''
+        Band energies of k-points (nk, 3) in fractional coordinates, computed in batches
+        of `chunk_size(max_mem)` k-points with a batched Hermitian diagonalization.
+
+        Return: (nk, num_wann)
+        '''
+        kpts = np.atleast_2d(kpts)
+        chunk = self.chunk_size(max_mem)
+        ebands = np.empty((len(kpts), self.num_wann))
+        for start in range(0, len(kpts), chunk):
+            ebands[start:start+chunk] = np.linalg.eigvalsh(self.hamiltonian(kpts[start:start+chunk]))
+        return ebands
+
+def mesh_kpoints(mesh, start=0, stop=None):
+    '''
+    Fractional coordinates of the k-points `start` ~ `stop` of the Gamma-centered
+    uniform `mesh` (n1, n2, n3), so that a chunk can be built without the full mesh.
+    '''
+    stop = np.prod(mesh) if stop is None else stop
+    return np.array(np.unravel_index(np.arange(start, stop), mesh)).T / np.asarray(mesh)
+
+# Hamiltonian of the worker processes, sent once by `init_worker` instead of with every chunk
+_worker_hr = None
+
+def init_worker(hr):
+    global _worker_hr
+    _worker_hr = hr
+
+def histogram_chunk(mesh, start, stop, edges):
+    '''
+    Number of band energies of k-points `start` ~ `stop` of `mesh` in each energy bin.
+    '''
+    ebands = _worker_hr.eigenvalues(mesh_kpoints(mesh, start, stop))
+    return np.histogram(ebands, bins=edges)[0]
+
+@profiled
+def wannier_dos(hr, mesh, energies, sigma=0., workers=None, chunk=None):
+    '''
+    DOS (states / eV per cell and spin) of `hr` (`WannierHR`) sampled on the uniform
+    k-point `mesh` (n1, n2, n3), on the evenly spaced grid `energies` (nedos,).
+
+    The mesh is cut into chunks of `chunk` k-points (256 MB in total by default) which
+    are diagonalized by `workers` processes. Each chunk only returns the histogram
+    of its band energies on `energies`, which is added to the total as soon as it arrives.
+    At most 2 * `workers` chunks are submitted at a time, so the memory doesn't depend
+    on the mesh size.
+    With `sigma` > 0 (eV), the summed histogram is broadened with a Gaussian.
+    The result can be integrated with `cumulative_dos` / `window_dos` of `pre_w90_tool`.
+
+    Return: dos (nedos,)
+    '''
+    de = energies[1] - energies[0]
+    edges = np.concatenate([energies - de / 2, [energies[-1] + de / 2]])
+    nk = int(np.prod(mesh))
+    workers = workers if workers else os.cpu_count()
+    chunk = chunk if chunk else hr.chunk_size(max_mem=256 / workers)
+
+    counts = np.zeros(len(energies), dtype=int)
+    with ProcessPoolExecutor(workers, initializer=init_worker, initargs=(hr,)) as pool:
+        pending = set()
+        for start in range(0, nk, chunk):
+            if len(pending) >= 2 * workers:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                counts += sum(f.result() for f in done)
+            pending.add(pool.submit(histogram_chunk, tuple(mesh), start, min(start + chunk, nk), edges))
+        counts += sum(f.result() for f in wait(pending).done)
+    dos = counts / (nk * de)
+    if sigma > 0:
+        from scipy.ndimage import gaussian_filter1d
+        dos = gaussian_filter1d(dos, sigma / de, mode='constant')
+    return dos
@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+import os
+import re
+import numpy as np
+
+NUM = rb'([-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)'
+# `iter  delta_spread  rms_gradient  spread  time  <-- CONV`
+CONV_RE = re.compile(rb'^\s*(\d+)\s+' + rb'\s+'.join([NUM] * 4) + rb'\s+<-- CONV')
+# `iter  omega_I(i-1)  omega_I(i)  delta  time  <-- DIS`
+DIS_RE = re.compile(rb'^\s*(\d+)\s+' + rb'\s+'.join([NUM] * 4) + rb'\s+<-- DIS')
+# `WF centre and spread  n  ( x, y, z )  spread`
+WF_RE = re.compile(rb'WF centre and spread\s+(\d+)\s+\(\s*' + rb'\s*,\s*'.join([NUM] * 3) + rb'\s*\)\s+' + NUM)
+
+class WoutParser():
+    '''
+    Incremental parser of `wannier90.wout`. Each `update` only reads the bytes appended
+    since the last call, so a running job can be followed without reading the file again.
+
+    conv:     (niter, 5) iter, delta spread, RMS gradient, spread (Ang^2), time of wannierisation
+    dis:      (niter, 5) iter, Omega_I(i-1), Omega_I(i), delta, time of disentanglement
+    centres:  (nwann, 3) WF centres (Ang) of the last printed block
+    spreads:  (nwann,)   WF spreads (Ang^2) of the last printed block
+    done:     True when wannier90 has finished
+    '''
+    def __init__(self, fname):
+        self.fname = fname
+        self.reset()
+
+    def reset(self):
+        self.offset = 0
+        self._tail = b''
+        self._conv, self._dis, self._wf = [], [], []
+        self.centres, self.spreads = np.zeros((0, 3)), np.zeros(0)
+        self.done = False
+
+    @property
+    def conv(self):
+        return np.array(self._conv).reshape(-1, 5)
+
+    @property
+    def dis(self):
+        return np.array(self._dis).reshape(-1, 5)
+
+    def update(self):
+        '''
+        Parse the lines appended since the last call. A partial last line is kept
+        until it's completed. The file is parsed again if it was truncated (rerun).
+
+        Return: number of new CONV and DIS lines
+        '''
+        if not os.path.isfile(self.fname):
+            return 0
+        if os.path.getsize(self.fname) < self.offset:
+            self.reset()
+        with open(self.fname, 'rb') as f:
+            f.seek(self.offset)
+            buf = f.read()
+        self.offset += len(buf)
+        buf = self._tail + buf
+        end = buf.rfind(b'\n') + 1
+        buf, self._tail = buf[:end], buf[end:]
+
+        nconv, ndis = len(self._conv), len(self._dis)
+        for line in buf.splitlines():
+            line = line.rstrip()
+            if line.endswith(b'<-- CONV'):
+                m = CONV_RE.match(line)
+                if m:
+                    self._conv.append(tuple(float(x) for x in m.groups()))
+            elif line.endswith(b'<-- DIS'):
+                m = DIS_RE.match(line)
+                if m:
+                    self._dis.append(tuple(float(x) for x in m.groups()))
+            elif b'WF centre and spread' in line:
+                m = WF_RE.search(line)
+                if m:
+                    if m.group(1) == b'1':
+                        self._wf = []
+                    self._wf.append(tuple(float(x) for x in m.groups()[1:]))
+            elif b'Sum of centres and spreads' in line and self._wf:
+                wf = np.array(self._wf)
+                self.centres, self.spreads = wf[:, :3], wf[:, 3]
+                self._wf = []
+            elif b'All done' in line:
+                self.done = True
+        return len(self._conv) - nconv + len(self._dis) - ndis